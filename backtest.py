@@ -0,0 +1,17 @@
+"""Module to backtest the signals of selectable indicators on the history of pairs"""
+import argparse
+import asyncio
+
+from backtest_handling import run_backtest
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("pairs", nargs="+", help="pairs to backtest, e.g. BTC/USDT")
+    parser.add_argument("--exchange", default="binance")
+    parser.add_argument("--timeframe", type=int, default=5, help="timeframe in minutes")
+    parser.add_argument("--days", type=float, default=30, help="days of history")
+    parser.add_argument(
+        "--trigger", nargs="+", default=["rsi"], choices=["bb", "stoch", "stochRsi", "rsi"],
+        help="indicators that all have to signal")
+    args = parser.parse_args()
+    asyncio.run(run_backtest(args.exchange, args.pairs, args.timeframe, args.days, args.trigger))
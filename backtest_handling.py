@@ -0,0 +1,138 @@
+"""Backtest handling, evaluates the signals of every candle of the history of pairs at once"""
+import asyncio
+import numpy as np
+
+from exchange_handling import (get_exchange, fetch_ohlcv, close_exchanges, get_timeframe,
+                               get_current_candle_timestamp)
+from history_handling import get_candle_store
+from candle_handling import CANDLE_COLUMNS
+from indicator_handling import (
+    NAN, stack_candles, calculate_indicators_matrix, get_signal_triggers)
+from budget_handling import PRIORITY_BACKFILL
+
+# Number of pairs of which the indicators are calculated at once, limits the memory use
+BACKTEST_CHUNK_SIZE = 16
+# Numbers of candles after a signal of which the return is measured
+BACKTEST_HORIZONS = [1, 5, 15, 60]
+# Number of candles fetched per request of the history
+HISTORY_PAGE_SIZE = 1000
+
+def get_signal_matrix(triggers, indicator_trigger_list, signal_type):
+    """Get candles triggered by all indicators of trigger list, like filter_signals"""
+    signals = np.ones(triggers[f"rsi{signal_type}"].shape, dtype=bool)
+    for indicator in indicator_trigger_list:
+        signals &= triggers[f"{indicator}{signal_type}"]
+    return signals
+
+def get_forward_returns(close, horizon):
+    """Get return of close after horizon candles, nan when not known yet"""
+    forward_returns = np.full(close.shape, NAN)
+    if horizon < close.shape[1]:
+        forward_returns[:, :-horizon] = close[:, horizon:] / close[:, :-horizon] - 1
+    return forward_returns
+
+def backtest(candle_list, indicator_trigger_list, horizons=None):
+    """Get number of signals, hit rate and mean forward return per signal type and horizon"""
+    horizons = BACKTEST_HORIZONS if horizons is None else horizons
+    totals = {
+        signal_type: {
+            "signals": 0,
+            "horizons": {horizon: {"count": 0, "hits": 0, "return_sum": 0.0}
+                         for horizon in horizons}}
+        for signal_type in ["Buy", "Sell"]}
+    for index in range(0, len(candle_list), BACKTEST_CHUNK_SIZE):
+        matrix = stack_candles(candle_list[index:index + BACKTEST_CHUNK_SIZE])
+        close = matrix["close"]
+        indicators = calculate_indicators_matrix(matrix["high"], matrix["low"], close)
+        triggers = get_signal_triggers(indicators)
+        forward_returns = {
+            horizon: get_forward_returns(close, horizon) for horizon in horizons}
+        for signal_type, total in totals.items():
+            signals = get_signal_matrix(triggers, indicator_trigger_list, signal_type) & \
+                ~np.isnan(close)
+            total["signals"] += int(signals.sum())
+            # A buy signal hits when the price rises, a sell signal when it falls
+            direction = 1 if signal_type == "Buy" else -1
+            for horizon, horizon_total in total["horizons"].items():
+                returns = forward_returns[horizon][signals]
+                returns = returns[~np.isnan(returns)]
+                horizon_total["count"] += len(returns)
+                horizon_total["hits"] += int((returns * direction > 0).sum())
+                horizon_total["return_sum"] += float(returns.sum())
+    report = {}
+    for signal_type, total in totals.items():
+        report[signal_type] = {"signals": total["signals"], "horizons": {}}
+        for horizon, horizon_total in total["horizons"].items():
+            count = horizon_total["count"]
+            report[signal_type]["horizons"][horizon] = {
+                "hit_rate": horizon_total["hits"] / count if count > 0 else NAN,
+                "mean_return": horizon_total["return_sum"] / count if count > 0 else NAN
+            }
+    return report
+
+async def fetch_candle_range(exchange_name, pair, timeframe, since, until):
+    """Fetch candles of pair from since till before until in pages"""
+    timeframe_ms = get_exchange(exchange_name).parse_timeframe(timeframe) * 1000
+    candles = []
+    while since < until:
+        bars = await fetch_ohlcv(
+            exchange_name, pair, timeframe, since=since, limit=HISTORY_PAGE_SIZE,
+            priority=PRIORITY_BACKFILL)
+        if bars is None:
+            # Keep the fetched candles, the next backtest fetches the missing candles
+            break
+        bars = [bar[:len(CANDLE_COLUMNS)] for bar in bars if bar[0] < until]
+        if len(bars) == 0:
+            break
+        candles.extend(bars)
+        since = int(bars[-1][0]) + timeframe_ms
+    return np.array(candles, dtype=float).reshape(-1, len(CANDLE_COLUMNS))
+
+async def fetch_history(exchange_name, pair, timeframe, since):
+    """Get closed candles of pair since timestamp, only candles not stored yet are fetched"""
+    exchange = get_exchange(exchange_name)
+    timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+    store = get_candle_store(exchange.id, pair, timeframe)
+    # The scanner of the bot appends to the store while the backtest runs
+    store.refresh_meta()
+    current_timestamp = get_current_candle_timestamp(exchange_name, timeframe)
+    if len(store) == 0:
+        store.append(await fetch_candle_range(
+            exchange_name, pair, timeframe, since, current_timestamp), timeframe_ms)
+        if len(store) > 0:
+            # No candles are missing before the first candle, the pair was listed later
+            store.set_start(since)
+        return store.read(since)
+    start = store.get_start()
+    older_candles = np.empty((0, len(CANDLE_COLUMNS)))
+    if start > since:
+        # The store is append only, the candles before its complete history are not stored
+        older_candles = await fetch_candle_range(exchange_name, pair, timeframe, since, start)
+    store.append(await fetch_candle_range(
+        exchange_name, pair, timeframe, max(since, store.last_timestamp() + timeframe_ms),
+        current_timestamp), timeframe_ms)
+    return np.concatenate([older_candles, store.read(max(since, start))])
+
+def format_report(report):
+    """Format backtest report as text"""
+    lines = []
+    for signal_type, signal_report in report.items():
+        lines.append(f"{signal_type} signals: {signal_report['signals']}")
+        for horizon, horizon_report in signal_report["horizons"].items():
+            lines.append(
+                f"  after {horizon:4d} candles: hit rate {horizon_report['hit_rate']:7.2%} " +
+                f"mean return {horizon_report['mean_return']:8.4%}")
+    return "\n".join(lines)
+
+async def run_backtest(exchange_name, pairs, timeframe_minute, days, indicator_trigger_list):
+    """Fetch history of pairs and print the backtest report"""
+    exchange = get_exchange(exchange_name)
+    timeframe = get_timeframe(timeframe_minute)
+    since = exchange.milliseconds() - days * 24 * 3600 * 1000
+    try:
+        candle_list = await asyncio.gather(
+            *[fetch_history(exchange_name, pair, timeframe, since) for pair in pairs])
+    finally:
+        await close_exchanges()
+    candle_list = [candles for candles in candle_list if len(candles) > 0]
+    print(format_report(backtest(candle_list, indicator_trigger_list)))
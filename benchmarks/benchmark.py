@@ -0,0 +1,229 @@
+"""Benchmark of the scan entry points against the fake exchange, compared with a baseline"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import budget_handling
+import exchange_handling
+import message_handling
+from file_handling import FILENAMEEXCHANGE, FILENAMEINDICATORTRIGGER
+from state_handling import set_chat_value
+from telegram_handling import send_signals
+from scheduler_handling import scan_subscriptions
+from indicator_handling import close_indicator_pool
+from history_handling import close_history
+from fake_exchange import FakeExchange, FAKE_LATENCY
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+PAIR_COUNTS = [10, 100, 1000]
+TIMEFRAME_COUNTS = [1, 3, 6]
+TIMEFRAME_MINUTES = [1, 3, 5, 15, 30, 60]
+INDICATOR_TRIGGER = ["rsi", "stochRsi"]
+# Milliseconds after midnight the clock of every case starts, the requests do not depend on
+# the time the benchmark runs
+CLOCK_START = 30000
+# Relative increase of time or memory over the baseline reported as regression
+REGRESSION_TOLERANCE = 0.25
+# Increases below these are no regression, the time and memory vary this much between runs
+REGRESSION_FLOORS = {"wall_time": 0.05, "cpu_time": 0.05, "peak_memory_mb": 1.0}
+# Chats subscribed to all pairs, their signals are rendered and queued like in the bot
+CHAT_IDS = ["1", "2"]
+
+class FakeMessage:
+    """Telegram message of which the replies and edits are dropped"""
+    message_id = 1
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+
+    async def reply_text(self, text, **kwargs):
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        return self
+
+def get_cases(pair_counts, timeframe_counts):
+    """Get the benchmark cases of pair and timeframe counts"""
+    cases = []
+    for pair_count in pair_counts:
+        cases.append(("get_pair_list", pair_count, 1, False))
+        for warm in [False, True]:
+            for timeframe_count in timeframe_counts:
+                cases.append(("scan_subscriptions", pair_count, timeframe_count, warm))
+    return cases
+
+def get_case_name(entry_point, pair_count, timeframe_count, warm):
+    """Get name of benchmark case"""
+    return f"{entry_point}[pairs={pair_count},timeframes={timeframe_count}," + \
+        f"{'warm' if warm else 'cold'}]"
+
+async def run_entry_point(entry_point, timeframe_count):
+    """Run entry point once on all pairs of the fake exchange"""
+    messages = {chat_id: FakeMessage(chat_id) for chat_id in CHAT_IDS}
+    if entry_point == "get_pair_list":
+        await exchange_handling.get_pair_list("binance", "USDT", 0, messages[CHAT_IDS[0]], "")
+        return
+    subscriptions = {
+        chat_id: {
+            "exchange": "binance",
+            "timeframes": TIMEFRAME_MINUTES[:timeframe_count],
+            "pairs": exchange_handling.get_exchange("binance").pairs,
+            "indicator_trigger": INDICATOR_TRIGGER
+        }
+        for chat_id in CHAT_IDS}
+
+    async def send_chat_signals(chat_id, timeframe_minute, signal_list):
+        await send_signals(messages[chat_id], chat_id, timeframe_minute, signal_list)
+
+    await scan_subscriptions(subscriptions, send_chat_signals)
+
+def set_clock_offset(fake_exchange, milliseconds):
+    """Move the clock of the fake exchange, the scan follows it like the synchronised clock"""
+    fake_exchange.clock_offset += milliseconds
+    exchange_handling.clock_offsets["binance"] = {
+        "time": time.monotonic(), "offset": fake_exchange.clock_offset}
+
+async def run_case_async(
+        entry_point, pair_count, timeframe_count, warm, latency, recorded, trace_memory):
+    """Run case and measure the time and requests of the last run of the entry point, or only
+    its peak memory when traced"""
+    fake_exchange = FakeExchange(pair_count, latency, recorded_directory=recorded)
+    exchange_handling.exchanges["binance"] = fake_exchange
+    # The clock stands still during a run, a long run does not cross a candle close
+    fake_exchange.local_time = exchange_handling.get_local_milliseconds()
+    exchange_handling.get_local_milliseconds = lambda: fake_exchange.local_time
+    set_clock_offset(fake_exchange, CLOCK_START - fake_exchange.milliseconds() % 86400000)
+    # The code is measured, not the wait for the request budget
+    budget_handling.REQUEST_WEIGHT_LIMITS["binance"] = (sys.maxsize, 60)
+    for chat_id in CHAT_IDS:
+        set_chat_value(FILENAMEEXCHANGE, chat_id, "binance")
+        set_chat_value(FILENAMEINDICATORTRIGGER, chat_id, INDICATOR_TRIGGER)
+    await exchange_handling.load_markets("binance")
+    if warm:
+        await run_entry_point(entry_point, timeframe_count)
+        # Scan again after the next candle of every timeframe closed
+        set_clock_offset(fake_exchange, max(TIMEFRAME_MINUTES[:timeframe_count]) * 60000)
+    fake_exchange.requests.clear()
+    fake_exchange.request_weight = 0
+    if trace_memory:
+        tracemalloc.start()
+    start_cpu_time = time.process_time()
+    start_time = time.perf_counter()
+    await run_entry_point(entry_point, timeframe_count)
+    if trace_memory:
+        # Including the candles stored in the background, the tracing is not stopped while
+        # threads may allocate
+        await close_history()
+        # Peak of the memory allocated during the run, of python objects and numpy arrays
+        result = {"peak_memory_mb": tracemalloc.get_traced_memory()[1] / 1024 / 1024}
+    else:
+        result = {
+            "wall_time": time.perf_counter() - start_time,
+            "cpu_time": time.process_time() - start_cpu_time,
+            "requests": sum(fake_exchange.requests.values()),
+            "request_weight": fake_exchange.request_weight,
+            "requests_by_method": dict(sorted(fake_exchange.requests.items()))
+        }
+    # The signals queued for the fake chat are not sent
+    message_handling.outbound_messages.clear()
+    await close_history()
+    await message_handling.close_message_queue()
+    await exchange_handling.close_exchanges()
+    close_indicator_pool()
+    return result
+
+def run_case(case, latency, recorded, indicator_mode, trace_memory=False):
+    """Run case in the working directory of a new process, no state is shared between cases"""
+    exchange_handling.INDICATOR_MODE = indicator_mode
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.makedirs("state")
+        return asyncio.run(run_case_async(*case, latency, recorded, trace_memory))
+
+def run_case_process(case, latency, recorded, indicator_mode, trace_memory=False):
+    """Run case in a new process"""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(
+            run_case, case, latency, recorded, indicator_mode, trace_memory).result()
+
+def compare_results(results, baseline):
+    """Get regressions of results compared with the baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ["wall_time", "cpu_time", "peak_memory_mb"]:
+            limit = baseline[name][metric] * (1 + REGRESSION_TOLERANCE)
+            if result[metric] > limit and \
+                result[metric] - baseline[name][metric] > REGRESSION_FLOORS[metric]:
+                regressions.append(
+                    f"{name} {metric} {result[metric]:.3f} > {baseline[name][metric]:.3f}")
+        for metric in ["requests", "request_weight"]:
+            if result[metric] > baseline[name][metric]:
+                regressions.append(
+                    f"{name} {metric} {result[metric]} > {baseline[name][metric]}")
+    return regressions
+
+def main():
+    """Run the benchmark cases and compare or save the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pairs", type=int, nargs="+", default=PAIR_COUNTS)
+    parser.add_argument("--timeframes", type=int, nargs="+", default=TIMEFRAME_COUNTS,
+                        choices=range(1, len(TIMEFRAME_MINUTES) + 1))
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="runs of every case of which the median time is reported")
+    parser.add_argument("--latency", type=float, default=None,
+                        help="seconds of latency per request of the fake exchange")
+    parser.add_argument("--recorded", default=None,
+                        help="history directory of an exchange, its 1m candles are replayed")
+    parser.add_argument("--indicator-mode", default=exchange_handling.INDICATOR_MODE,
+                        choices=["stream", "batch", "process"])
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="save the results as the new baseline")
+    args = parser.parse_args()
+    latency = FAKE_LATENCY if args.latency is None else args.latency
+    recorded = None if args.recorded is None else os.path.abspath(args.recorded)
+    results = {}
+    for case in get_cases(args.pairs, args.timeframes):
+        name = get_case_name(*case)
+        if args.indicator_mode != exchange_handling.INDICATOR_MODE:
+            name += f"[{args.indicator_mode}]"
+        runs = [run_case_process(case, latency, recorded, args.indicator_mode)
+                for _ in range(args.repeat)]
+        result = runs[0]
+        for metric in ["wall_time", "cpu_time"]:
+            result[metric] = statistics.median(run[metric] for run in runs)
+        # The memory is traced in a run of its own, tracing slows down the measured time
+        result["peak_memory_mb"] = run_case_process(
+            case, latency, recorded, args.indicator_mode, trace_memory=True)["peak_memory_mb"]
+        results[name] = result
+        print(f"{name:55s} wall {result['wall_time']:7.3f}s cpu {result['cpu_time']:7.3f}s " +
+              f"memory {result['peak_memory_mb']:7.1f}MB requests {result['requests']:6d} " +
+              f"weight {result['request_weight']:6d}")
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump({**baseline, **results}, file, indent=2)
+        return
+    regressions = compare_results(results, baseline)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    sys.exit(1 if len(regressions) > 0 else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Fake exchange, serves synthetic or recorded candles and tickers in process with a latency"""
+import asyncio
+import os
+import zlib
+import numpy as np
+import ccxt.async_support as ccxt_async
+
+from budget_handling import get_request_weight
+from candle_handling import resample_candles
+from history_handling import CandleStore
+
+# Seconds of simulated network latency per request
+FAKE_LATENCY = 0.02
+# Interval of the candles the other timeframes are aggregated from
+FAKE_BASE_TIMEFRAME_MS = 60000
+
+class FakeExchange(ccxt_async.binance):
+    """Binance client answering from generated candles instead of the network"""
+
+    def __init__(self, pair_count, latency=FAKE_LATENCY, quote="USDT", recorded_directory=None):
+        super().__init__({"enableRateLimit": False})
+        self.pairs = [f"P{index:04d}/{quote}" for index in range(pair_count)]
+        self.quote = quote
+        self.latency = latency
+        self.requests = {}
+        self.request_weight = 0
+        # Milliseconds the clock of the fake exchange is ahead of the local clock
+        self.clock_offset = 0
+        # Local time in milliseconds the clock stands still at, None follows the local clock
+        self.local_time = None
+        self.recorded_candles = []
+        if recorded_directory is not None:
+            self.recorded_candles = load_recorded_candles(recorded_directory)
+
+    def count_request(self, method, limit=None):
+        """Count request of method and its weight"""
+        self.requests[method] = self.requests.get(method, 0) + 1
+        self.request_weight += get_request_weight(self.id, method, limit)
+
+    async def load_markets(self, reload=False, params={}):
+        if self.markets is not None and not reload:
+            return self.markets
+        self.count_request("load_markets")
+        await asyncio.sleep(self.latency)
+        self.set_markets([{
+            "id": pair.replace("/", ""), "symbol": pair, "base": pair.split("/")[0],
+            "quote": self.quote, "baseId": pair.split("/")[0], "quoteId": self.quote,
+            "type": "spot", "spot": True, "active": True} for pair in self.pairs], {})
+        return self.markets
+
+    def milliseconds(self):
+        local_time = super().milliseconds() if self.local_time is None else self.local_time
+        return local_time + self.clock_offset
+
+    async def fetch_time(self, params={}):
+        self.count_request("fetch_time")
+        await asyncio.sleep(self.latency)
+        return self.milliseconds()
+
+    async def fetch_tickers(self, symbols=None, params={}):
+        self.count_request("fetch_tickers")
+        await asyncio.sleep(self.latency)
+        minutes = self.milliseconds() // FAKE_BASE_TIMEFRAME_MS
+        return {pair: {"symbol": pair, "quoteVolume": float(1e5 * (1 + get_seed(pair) % 1000)),
+                       "open": float(get_price(get_seed(pair), minutes - 24 * 60)),
+                       "last": float(get_price(get_seed(pair), minutes))}
+                for pair in self.pairs}
+
+    async def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params={}):
+        self.count_request("fetch_ohlcv", limit)
+        await asyncio.sleep(self.latency)
+        limit = 500 if limit is None else limit
+        timeframe_ms = self.parse_timeframe(timeframe) * 1000
+        # The candle not closed yet is included like on the exchange
+        end = self.milliseconds() // timeframe_ms * timeframe_ms + timeframe_ms
+        if since is None:
+            start = end - limit * timeframe_ms
+        else:
+            start = since // timeframe_ms * timeframe_ms
+        end = min(end, start + limit * timeframe_ms)
+        # The candle not closed yet only has the base candles till now
+        base_end = self.milliseconds() // FAKE_BASE_TIMEFRAME_MS * FAKE_BASE_TIMEFRAME_MS + \
+            FAKE_BASE_TIMEFRAME_MS
+        candles = self.get_base_candles(symbol, start, min(end, base_end))
+        if timeframe_ms != FAKE_BASE_TIMEFRAME_MS:
+            candles = resample_candles(candles, timeframe_ms)
+        return candles.tolist()
+
+    def get_base_candles(self, pair, start, end):
+        """Get base candles of pair from start till before end"""
+        timestamps = np.arange(start, end, FAKE_BASE_TIMEFRAME_MS, dtype=np.int64)
+        seed = get_seed(pair)
+        if len(self.recorded_candles) > 0:
+            return get_recorded_candles(
+                self.recorded_candles[seed % len(self.recorded_candles)], timestamps)
+        return get_synthetic_candles(seed, timestamps)
+
+    async def close(self):
+        pass
+
+def get_seed(pair):
+    """Get stable seed of pair"""
+    return zlib.crc32(pair.encode())
+
+def get_price(seed, minutes):
+    """Get deterministic price of minutes, overlapping waves with noise move like a market"""
+    phase = seed % 1000
+    noise = np.sin(minutes * 12.9898 + phase * 78.233) * 43758.5453
+    noise -= np.floor(noise)
+    return 100 * np.exp(0.05 * np.sin(minutes / 700 + phase) + 0.01 * np.sin(minutes / 45 + phase) +
+                        0.002 * (noise - 0.5))
+
+def get_synthetic_candles(seed, timestamps):
+    """Get synthetic base candles at timestamps, the same for every request"""
+    minutes = timestamps // FAKE_BASE_TIMEFRAME_MS
+    open_price = get_price(seed, minutes)
+    close = get_price(seed, minutes + 1)
+    return np.column_stack((
+        timestamps, open_price, np.maximum(open_price, close) * 1.001,
+        np.minimum(open_price, close) * 0.999, close, 1000 + seed % 100 * np.ones(len(minutes))))
+
+def load_recorded_candles(directory):
+    """Load the 1m candles of the pairs stored in the history directory of an exchange"""
+    recorded_candles = []
+    for pair_name in sorted(os.listdir(directory)):
+        candle_directory = os.path.join(directory, pair_name, "1m")
+        if os.path.isdir(candle_directory):
+            candles = CandleStore(candle_directory).read()
+            if len(candles) > 0:
+                recorded_candles.append(candles)
+    if len(recorded_candles) == 0:
+        raise ValueError(f"No 1m candles stored in {directory}")
+    return recorded_candles
+
+def get_recorded_candles(candles, timestamps):
+    """Get recorded candles replayed cyclically at timestamps"""
+    indices = (timestamps // FAKE_BASE_TIMEFRAME_MS) % len(candles)
+    replayed = candles[indices].copy()
+    replayed[:, 0] = timestamps
+    return replayed
@@ -0,0 +1,144 @@
+"""Budget handling, keeps the request weight per exchange within its rolling rate limit"""
+import asyncio
+import time
+from collections import deque
+
+# Request weight allowed per window in seconds, below the documented limits of the exchange
+REQUEST_WEIGHT_LIMITS = {
+    "binance": (4800, 60),
+    "bybit": (480, 5),
+    "kucoin": (1600, 30)
+}
+DEFAULT_REQUEST_WEIGHT_LIMIT = (600, 60)
+# Seconds the requests to an exchange are paused after it answered with a rate limit error
+RATE_LIMIT_PAUSE = 60
+
+# Lower is served first, backfill and discovery leave part of the budget to live scans
+PRIORITY_LIVE = 0
+PRIORITY_DISCOVERY = 1
+PRIORITY_BACKFILL = 2
+PRIORITY_BUDGET_SHARE = {
+    PRIORITY_LIVE: 1.0,
+    PRIORITY_DISCOVERY: 0.7,
+    PRIORITY_BACKFILL: 0.5
+}
+
+# Weight of endpoints per exchange, candle weights by the upper bound of the limit
+REQUEST_WEIGHTS = {
+    "binance": {
+        "fetch_ohlcv": [(99, 1), (499, 2), (1000, 5), (None, 10)],
+        "fetch_tickers": 80,
+        "load_markets": 25
+    },
+    "kucoin": {
+        "fetch_ohlcv": 3,
+        "fetch_tickers": 15,
+        "load_markets": 8
+    }
+}
+DEFAULT_REQUEST_WEIGHT = 1
+# Response header with the weight used by the exchange in its current window
+USED_WEIGHT_HEADERS = {
+    "binance": "x-mbx-used-weight-1m"
+}
+
+class RequestBudget:
+    """Rolling window of the request weight spent on an exchange"""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.requests = deque()
+        self.used = 0
+        self.paused_until = 0
+        self.waiting = {priority: 0 for priority in PRIORITY_BUDGET_SHARE}
+        self.condition = asyncio.Condition()
+
+    def expire(self):
+        """Remove the requests older than the window"""
+        now = time.monotonic()
+        while len(self.requests) > 0 and self.requests[0][0] <= now - self.window:
+            self.used -= self.requests.popleft()[1]
+
+    def get_remaining(self):
+        """Get weight remaining in the current window"""
+        self.expire()
+        return max(0, self.limit - self.used)
+
+    def get_delay(self, weight, priority):
+        """Get seconds till weight can be spent with priority, None while higher priority waits"""
+        now = time.monotonic()
+        if self.paused_until > now:
+            return self.paused_until - now
+        if any(self.waiting[higher] > 0 for higher in self.waiting if higher < priority):
+            return None
+        self.expire()
+        if self.used == 0 or self.used + weight <= self.limit * PRIORITY_BUDGET_SHARE[priority]:
+            return 0
+        return self.requests[0][0] + self.window - now
+
+    def spend(self, weight):
+        """Record weight spent now"""
+        self.requests.append((time.monotonic(), weight))
+        self.used += weight
+
+    def correct(self, used_weight):
+        """Record the weight the exchange reports as used when it is more than recorded"""
+        self.expire()
+        if used_weight > self.used:
+            self.spend(used_weight - self.used)
+
+budgets = {}
+
+def get_budget(exchange_id):
+    """Get request budget of exchange"""
+    if exchange_id not in budgets:
+        budgets[exchange_id] = RequestBudget(
+            *REQUEST_WEIGHT_LIMITS.get(exchange_id, DEFAULT_REQUEST_WEIGHT_LIMIT))
+    return budgets[exchange_id]
+
+def get_request_weight(exchange_id, method, limit=None):
+    """Get weight of request of method to exchange"""
+    weight = REQUEST_WEIGHTS.get(exchange_id, {}).get(method, DEFAULT_REQUEST_WEIGHT)
+    if isinstance(weight, list):
+        for max_limit, limit_weight in weight:
+            if max_limit is None or (limit or 500) <= max_limit:
+                return limit_weight
+    return weight
+
+async def acquire_budget(exchange_id, weight, priority=PRIORITY_LIVE):
+    """Wait till weight fits in the budget of exchange and spend it"""
+    budget = get_budget(exchange_id)
+    async with budget.condition:
+        budget.waiting[priority] += 1
+        try:
+            while True:
+                delay = budget.get_delay(weight, priority)
+                if delay == 0:
+                    break
+                try:
+                    await asyncio.wait_for(budget.condition.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            budget.waiting[priority] -= 1
+            budget.condition.notify_all()
+        budget.spend(weight)
+
+def report_response(exchange_id, headers):
+    """Correct the budget of exchange with the used weight in the response headers"""
+    header = USED_WEIGHT_HEADERS.get(exchange_id)
+    if header is None or headers is None:
+        return
+    for name, value in headers.items():
+        if name.lower() == header:
+            get_budget(exchange_id).correct(int(value))
+
+def pause_budget(exchange_id, seconds=RATE_LIMIT_PAUSE):
+    """Pause requests to exchange, e.g. after a rate limit error"""
+    budget = get_budget(exchange_id)
+    budget.paused_until = max(budget.paused_until, time.monotonic() + seconds)
+
+def get_remaining_budget(exchange_id):
+    """Get request weight remaining in the current window of exchange"""
+    return get_budget(exchange_id).get_remaining()
@@ -0,0 +1,106 @@
+"""Candle handling with resident ring buffers per exchange, pair and timeframe"""
+import asyncio
+import numpy as np
+
+# Number of candles kept per exchange, pair and timeframe
+CANDLE_CAPACITY = 500
+CANDLE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+candle_buffers = {}
+candle_locks = {}
+
+class CandleBuffer:
+    """Fixed capacity ring buffer of candles ordered by timestamp"""
+
+    def __init__(self, capacity=CANDLE_CAPACITY):
+        self.capacity = capacity
+        self.values = np.zeros((capacity, len(CANDLE_COLUMNS)))
+        self.start = 0
+        self.count = 0
+        # Number of closed candles before the last candle the buffer was filled with
+        self.depth = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        """Remove all candles"""
+        self.start = 0
+        self.count = 0
+        self.depth = 0
+
+    def get_fill_depth(self, depth=None):
+        """Get number of closed candles to fill the buffer with, None for its capacity"""
+        max_depth = self.capacity - 1
+        return max_depth if depth is None else min(depth, max_depth)
+
+    def first_timestamp(self):
+        """Get timestamp of first stored candle"""
+        if self.count == 0:
+            return None
+        return int(self.values[self.start, 0])
+
+    def last_timestamp(self):
+        """Get timestamp of last stored candle"""
+        if self.count == 0:
+            return None
+        return int(self.values[(self.start + self.count - 1) % self.capacity, 0])
+
+    def append(self, bars):
+        """Append bars, a bar with the timestamp of the last candle replaces it"""
+        if len(bars) == 0:
+            return
+        bars = np.asarray(bars, dtype=float)[:, :len(CANDLE_COLUMNS)]
+        # Sort on timestamp and keep the most recent version of duplicate bars
+        bars = bars[np.argsort(bars[:, 0], kind="stable")]
+        keep = np.append(bars[1:, 0] != bars[:-1, 0], True)
+        bars = bars[keep]
+        last_timestamp = self.last_timestamp()
+        if last_timestamp is not None:
+            bars = bars[bars[:, 0] >= last_timestamp]
+            if len(bars) > 0 and bars[0, 0] == last_timestamp:
+                self.values[(self.start + self.count - 1) % self.capacity] = bars[0]
+                bars = bars[1:]
+        bars = bars[-self.capacity:]
+        indices = (self.start + self.count + np.arange(len(bars))) % self.capacity
+        self.values[indices] = bars
+        overflow = max(0, self.count + len(bars) - self.capacity)
+        self.start = (self.start + overflow) % self.capacity
+        self.count = min(self.count + len(bars), self.capacity)
+
+    def get_candles(self):
+        """Get copy of candles ordered by timestamp"""
+        return self.values[(self.start + np.arange(self.count)) % self.capacity]
+
+def resample_candles(candles, timeframe_ms):
+    """Aggregate candles into candles of timeframe aligned to the timeframe boundaries"""
+    if len(candles) == 0:
+        return candles
+    buckets = candles[:, 0] // timeframe_ms * timeframe_ms
+    starts = np.flatnonzero(np.append(True, buckets[1:] != buckets[:-1]))
+    ends = np.append(starts[1:], len(candles)) - 1
+    resampled = np.column_stack((
+        buckets[starts],
+        candles[starts, 1],
+        np.maximum.reduceat(candles[:, 2], starts),
+        np.minimum.reduceat(candles[:, 3], starts),
+        candles[ends, 4],
+        np.add.reduceat(candles[:, 5], starts)))
+    if candles[0, 0] != buckets[0]:
+        # The first candle is not at a boundary, the first aggregated candle is incomplete
+        resampled = resampled[1:]
+    return resampled
+
+def get_candle_buffer(exchange_name, pair, timeframe):
+    """Get candle buffer of exchange, pair and timeframe"""
+    key = (exchange_name, pair, timeframe)
+    if key not in candle_buffers:
+        candle_buffers[key] = CandleBuffer()
+    return candle_buffers[key]
+
+def get_candle_lock(exchange_name, pair, timeframe):
+    """Get lock preventing concurrent updates of the same candle buffer"""
+    key = (exchange_name, pair, timeframe)
+    if key not in candle_locks:
+        candle_locks[key] = asyncio.Lock()
+    return candle_locks[key]
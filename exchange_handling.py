@@ -1,227 +1,449 @@
 """Exchange handling"""
-from datetime import datetime
+import asyncio
+import time
 import ccxt
-import pandas as pd
-import pytz
+import ccxt.async_support as ccxt_async
+import ccxt.pro as ccxt_pro
 
-from ta.momentum import RSIIndicator, StochRSIIndicator, StochasticOscillator
-from ta.trend import MACD, EMAIndicator
-from ta.volatility import BollingerBands
-from telegram.error import TimedOut
+from file_handling import load_json, save_json, FILENAMEMARKETS
+from candle_handling import get_candle_buffer, get_candle_lock, resample_candles
+from indicator_handling import (calculate_indicators_batch, calculate_indicators_parallel,
+                                update_indicator_state, get_history_depth, NAN)
+from signal_handling import SignalTable
+from message_handling import edit_text
+from history_handling import store_history, load_history, STORE_HISTORY
+from transport_handling import install_transport, get_local_milliseconds
+from metrics_handling import (TICKER_FETCH_SECONDS, OHLCV_FETCH_SECONDS, INDICATOR_SECONDS,
+                              TRIGGER_SECONDS, EXCHANGE_ERRORS)
+from budget_handling import (acquire_budget, get_request_weight, report_response, pause_budget,
+                             PRIORITY_LIVE, PRIORITY_DISCOVERY, PRIORITY_BACKFILL)
 
-dataList = {}
-prev_timefram_minute_list = {}
+# Maximum number of concurrent requests per exchange
+MAX_CONCURRENT_REQUESTS = {
+    "binance": 10,
+    "bybit": 5,
+    "kucoin": 5
+}
+DEFAULT_MAX_CONCURRENT_REQUESTS = 5
+request_semaphores = {}
 
-EXCHANGE = ccxt.binance()
+# Indicator calculation, "stream" updates the indicators per pair with each closed candle,
+# "batch" calculates the indicators of all pairs at once over the stacked candles and
+# "process" calculates them like batch in chunks of pairs on worker processes
+INDICATOR_MODE = "stream"
 
-def set_exchange(exchange_name):
-    """Set exchange"""
-    global EXCHANGE
-    if exchange_name in ccxt.exchanges:
-        exchange_class = getattr(ccxt, exchange_name)
-        EXCHANGE = exchange_class()
-    else:
-        EXCHANGE = ccxt.binance()
+# Seconds a ticker snapshot of an exchange stays valid
+TICKER_SNAPSHOT_TTL = 60
+ticker_snapshots = {}
+ticker_snapshot_locks = {}
+
+# Seconds between synchronisations of the local clock with the exchange clock
+CLOCK_SYNC_INTERVAL = 3600
+clock_offsets = {}
+
+# Seconds before the markets cached on disk are refreshed in the background
+MARKETS_REFRESH_INTERVAL = 24 * 3600
+# Seconds before a failed download of the markets is retried in the background
+MARKETS_RETRY_DELAY = 60
+market_refresh_tasks = {}
+market_locks = {}
+# Active symbols per exchange by quote currency and market type
+market_index = {}
+
+# Build the candles of higher timeframes from the candles of the base timeframe, the higher
+# timeframes are fetched from the exchange only once to warm up
+RESAMPLE_TIMEFRAMES = True
+RESAMPLE_BASE_TIMEFRAME = "1m"
+
+# Keep candle buffers up to date over WebSocket, the scan then only fetches candles over REST
+# when the stream fell behind
+CANDLE_STREAMING = False
+# WebSocket urls per exchange replacing the urls of the client, e.g. of a local test server
+STREAM_URLS = {}
+
+exchanges = {}
+
+def get_exchange(exchange_name):
+    """Get the long-lived client of exchange, unknown exchanges fall back to binance"""
+    if exchange_name not in ccxt_async.exchanges:
+        exchange_name = "binance"
+    if exchange_name not in exchanges:
+        if CANDLE_STREAMING and exchange_name in ccxt_pro.exchanges:
+            exchange_class = getattr(ccxt_pro, exchange_name)
+        else:
+            exchange_class = getattr(ccxt_async, exchange_name)
+        exchange = exchange_class({"enableRateLimit": True})
+        if exchange_name in STREAM_URLS:
+            exchange.urls["api"]["ws"] = {
+                **exchange.urls["api"].get("ws", {}), **STREAM_URLS[exchange_name]}
+        install_transport(exchange)
+        exchanges[exchange_name] = exchange
+    return exchanges[exchange_name]
+
+def build_market_index(exchange):
+    """Index active symbols of exchange by quote currency and market type"""
+    index = {}
+    for symbol, market in exchange.markets.items():
+        if market.get("active"):
+            index.setdefault((market["quote"], market["type"]), []).append(symbol)
+    market_index[exchange.id] = index
+
+async def refresh_markets(exchange_name):
+    """Download markets of exchange and cache them on disk"""
+    exchange = get_exchange(exchange_name)
+    await request_exchange(exchange_name, "load_markets", reload=True, priority=PRIORITY_DISCOVERY)
+    build_market_index(exchange)
+    cache = {
+        "time": time.time(),
+        "markets": list(exchange.markets.values()),
+        "currencies": exchange.currencies
+    }
+    await asyncio.to_thread(save_json, FILENAMEMARKETS.format(exchange.id), cache)
+
+async def refresh_markets_periodically(exchange_name, delay):
+    """Refresh markets of exchange in the background every refresh interval"""
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await refresh_markets(exchange_name)
+            delay = MARKETS_REFRESH_INTERVAL
+        except ccxt.BaseError as exception:
+            print(f"Error refreshing markets of {exchange_name}: " +
+                  f"{type(exception).__name__} {exception}")
+            delay = MARKETS_RETRY_DELAY
 
-def set_previous_timeframe_minute_list(chat_id, timeframe_minute_list):
-    """Set previous timeframe minute list"""
-    global prev_timefram_minute_list
-    prev_timefram_minute_list[chat_id] = dict([[x, ""] for x in timeframe_minute_list])
+def start_market_refresh(exchange_name, delay):
+    """Start the refresh of the markets of exchange in the background once"""
+    exchange_id = get_exchange(exchange_name).id
+    if exchange_id not in market_refresh_tasks:
+        market_refresh_tasks[exchange_id] = asyncio.create_task(
+            refresh_markets_periodically(exchange_name, delay))
 
+async def load_markets(exchange_name):
+    """Load markets of exchange once, from the disk cache when available"""
+    exchange = get_exchange(exchange_name)
+    if exchange.id not in market_locks:
+        market_locks[exchange.id] = asyncio.Lock()
+    async with market_locks[exchange.id]:
+        if exchange.markets is not None:
+            # Markets may have been loaded by ccxt itself on the first request
+            if exchange.id not in market_index:
+                build_market_index(exchange)
+            return exchange.markets
+        try:
+            cache = await asyncio.to_thread(load_json, FILENAMEMARKETS.format(exchange.id))
+        except ValueError:
+            print(f"Markets cache of {exchange.id} is corrupt")
+            cache = {}
+        if "markets" in cache:
+            exchange.set_markets(cache["markets"], cache["currencies"])
+            build_market_index(exchange)
+            refresh_delay = max(0, cache["time"] + MARKETS_REFRESH_INTERVAL - time.time())
+        else:
+            try:
+                await refresh_markets(exchange_name)
+            except ccxt.BaseError:
+                # The refresh in the background retries the download
+                start_market_refresh(exchange_name, MARKETS_RETRY_DELAY)
+                raise
+            refresh_delay = MARKETS_REFRESH_INTERVAL
+        start_market_refresh(exchange_name, refresh_delay)
+    return exchange.markets
+
+def get_active_symbols(exchange_name, quote, market_types=None):
+    """Get active symbols of exchange with quote currency, optionally of market types only"""
+    index = market_index.get(get_exchange(exchange_name).id, {})
+    return [symbol for (index_quote, market_type), symbols in index.items()
+            if index_quote == quote and (market_types is None or market_type in market_types)
+            for symbol in symbols]
+
+async def close_exchanges():
+    """Close connections of all exchange clients"""
+    for task in market_refresh_tasks.values():
+        task.cancel()
+    market_refresh_tasks.clear()
+    for exchange in exchanges.values():
+        await exchange.close()
+    exchanges.clear()
+
+def get_request_semaphore(exchange_name):
+    """Get semaphore limiting the concurrent requests of exchange"""
+    if exchange_name not in request_semaphores:
+        request_semaphores[exchange_name] = asyncio.Semaphore(
+            MAX_CONCURRENT_REQUESTS.get(exchange_name, DEFAULT_MAX_CONCURRENT_REQUESTS))
+    return request_semaphores[exchange_name]
+
+async def request_exchange(exchange_name, method, *args, priority=PRIORITY_LIVE, **kwargs):
+    """Call method of the exchange client within the concurrency limit and weight budget"""
+    exchange = get_exchange(exchange_name)
+    weight = get_request_weight(exchange.id, method, kwargs.get("limit"))
+    await acquire_budget(exchange.id, weight, priority)
+    async with get_request_semaphore(exchange.id):
+        try:
+            return await getattr(exchange, method)(*args, **kwargs)
+        except ccxt.BaseError as exception:
+            EXCHANGE_ERRORS.labels(exchange.id, method, type(exception).__name__).inc()
+            if isinstance(exception, (ccxt.RateLimitExceeded, ccxt.DDoSProtection)):
+                # Pause all requests to the exchange to avoid a ban
+                pause_budget(exchange.id)
+            raise
+        finally:
+            report_response(exchange.id, exchange.last_response_headers)
+
+async def sync_clock(exchange_name):
+    """Synchronise the offset of the local clock with the exchange clock"""
+    exchange = get_exchange(exchange_name)
+    clock_offset = clock_offsets.get(exchange.id)
+    if clock_offset is not None and \
+        time.monotonic() - clock_offset["time"] < CLOCK_SYNC_INTERVAL:
+        return
+    offset = 0 if clock_offset is None else clock_offset["offset"]
+    try:
+        request_time = get_local_milliseconds()
+        server_time = await request_exchange(exchange_name, "fetch_time")
+        offset = int(server_time - (request_time + get_local_milliseconds()) / 2)
+    except (ccxt.NetworkError, ccxt.NotSupported):
+        print(f"Clock of {exchange.id} not synchronised")
+    clock_offsets[exchange.id] = {"time": time.monotonic(), "offset": offset}
+
+def get_exchange_milliseconds(exchange_name):
+    """Get current time of the exchange clock in milliseconds"""
+    clock_offset = clock_offsets.get(exchange_name)
+    return get_local_milliseconds() + (0 if clock_offset is None else clock_offset["offset"])
+
+def get_current_candle_timestamp(exchange_name, timeframe):
+    """Get open timestamp of the candle not closed yet on the exchange clock"""
+    exchange = get_exchange(exchange_name)
+    timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+    return get_exchange_milliseconds(exchange.id) // timeframe_ms * timeframe_ms
+
+def get_timeframe(timeframe_minute):
+    """Get exchange timeframe of timeframe in minutes"""
+    timeframe_minute = int(timeframe_minute)
+    if timeframe_minute > 30:
+        return str(int(timeframe_minute / 60)) + 'h'
+    return str(timeframe_minute) + 'm'
 
-async def get_pair_list(base_coin, min_day_volume, message, heading):
+async def get_pair_list(exchange_name, base_coin, min_day_volume, message, heading):
     """Get pair list"""
-    EXCHANGE.load_markets()
-    coin_pairs = [p for p in EXCHANGE.symbols \
-        if '/' + base_coin in p and 'BUSD' not in p]
+    await load_markets(exchange_name)
+    coin_pairs = [p for p in get_active_symbols(exchange_name, base_coin) if 'BUSD' not in p]
+    edit_text(message, f"{heading}Checking {len(coin_pairs)} pairs")
+    tickers = await fetch_tickers(exchange_name, coin_pairs, priority=PRIORITY_DISCOVERY)
     valid_coin_pairs = []
-    current_coin_pair = 0
     for coin_pair in coin_pairs:
-        current_coin_pair += 1
-        if EXCHANGE.markets[coin_pair]['active']:
-            if current_coin_pair % 10 == 0:
-                try:
-                    await message.edit_text(f"{heading}Checking pair:\n{coin_pair}")
-                except (TimedOut) as exception:
-                    print(f"Message with coin pair {coin_pair} got exception {exception}")
-            ticker = fetch_ticker(coin_pair)
-            if ticker is None:
-                continue
-            if ticker["quoteVolume"] > min_day_volume:
-                valid_coin_pairs.append(coin_pair)
+        ticker = tickers.get(coin_pair)
+        if ticker is None or ticker["quoteVolume"] is None:
+            continue
+        if ticker["quoteVolume"] > min_day_volume:
+            valid_coin_pairs.append(coin_pair)
     return valid_coin_pairs
 
-def copy_data(pair_list, timeframe_minute, date_time):
-    """Copy pair list data"""
-    data = {}
-    for pair_from_list in dataList[timeframe_minute][date_time]:
-        if pair_from_list in pair_list:
-            data[pair_from_list] = dataList[timeframe_minute][date_time]
-    return data
-
-async def retrieve_signals(
-        message, timeframe_minute, pair_list, indicator_trigger_list):
-    """Retrieve buy and sell signals"""
-    chat_id = str(message.chat_id)
-    timeframe_minute = int(timeframe_minute)
-    if timeframe_minute > 30:
-        timeframe = str(int(timeframe_minute / 60)) + 'h'
-    else:
-        timeframe = str(timeframe_minute) + 'm'
-    data = {}
-    for pair in pair_list[chat_id]:
-        if len(data) > 0 and pair in data:
-            continue
-        ticker = fetch_ticker(pair)
-        if ticker is None:
-            continue
-        quote_volume_m = ticker["quoteVolume"]/1000000
+async def fetch_ohlcv(exchange_name, pair, timeframe, since=None, limit=500,
+                      priority=PRIORITY_LIVE):
+    """Fetch candles of pair"""
+    try:
+        with OHLCV_FETCH_SECONDS.labels(get_exchange(exchange_name).id, timeframe).time():
+            return await request_exchange(
+                exchange_name, "fetch_ohlcv", pair, timeframe=timeframe, since=since,
+                limit=limit, priority=priority)
+    except ccxt.BaseError as exception:
+        # A failing pair is skipped, the other pairs of the scan go on
+        print(f"Error fetching candles of {pair}: {type(exception).__name__} {exception}")
+    return None
 
-        bars = EXCHANGE.fetch_ohlcv(pair, timeframe=timeframe, limit=500)
-        data_frame = pd.DataFrame(
-            bars[:-1], columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        if data_frame.empty:
-            continue
-        timestamp = int(data_frame["timestamp"].iloc[-1])/1000
-        date_time = datetime.fromtimestamp(timestamp, pytz.timezone('Europe/Amsterdam'))
-        if len(data) == 0:
-            if chat_id in prev_timefram_minute_list and \
-                timeframe_minute in prev_timefram_minute_list[chat_id] and \
-                date_time == prev_timefram_minute_list[chat_id][timeframe_minute]:
+async def fetch_candles(exchange_name, pair, timeframe, depth=None):
+    """Update candle buffer of pair with the candles since the last stored candle, filled with
+    at least depth closed candles, None for the capacity of the buffer"""
+    exchange = get_exchange(exchange_name)
+    candle_buffer = get_candle_buffer(exchange.id, pair, timeframe)
+    depth = candle_buffer.get_fill_depth(depth)
+    async with get_candle_lock(exchange.id, pair, timeframe):
+        timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+        current_timestamp = get_current_candle_timestamp(exchange_name, timeframe)
+        if len(candle_buffer) == 0 and STORE_HISTORY:
+            # Warm start from the stored candles, only the newer candles are fetched
+            candle_buffer.append(
+                await load_history(exchange.id, pair, timeframe, candle_buffer.capacity))
+            candle_buffer.depth = len(candle_buffer)
+        last_timestamp = candle_buffer.last_timestamp()
+        if last_timestamp is None or depth > candle_buffer.depth or \
+            last_timestamp < current_timestamp - timeframe_ms * depth:
+            # Empty buffer, not filled deep enough or gap larger than the depth, backfill the
+            # candles of the depth and the candle not closed yet, a last stored candle depth
+            # candles ago is refetched with the newer candles
+            bars = await fetch_ohlcv(
+                exchange_name, pair, timeframe, limit=depth + 1, priority=PRIORITY_BACKFILL)
+            if bars is None:
+                return None
+            candle_buffer.clear()
+            candle_buffer.append(bars)
+            candle_buffer.depth = depth
+            return candle_buffer.get_candles()
+        # Refetch the last stored candle, it was possibly not closed when fetched
+        while last_timestamp < current_timestamp:
+            limit = min(
+                (current_timestamp - last_timestamp) // timeframe_ms + 1, candle_buffer.capacity)
+            bars = await fetch_ohlcv(
+                exchange_name, pair, timeframe, since=last_timestamp, limit=limit)
+            if bars is None:
+                return None
+            candle_buffer.append(bars)
+            if len(bars) < limit:
                 break
-            elif timeframe_minute in dataList and \
-                date_time in dataList[timeframe_minute]:
-                data = copy_data(pair_list, timeframe_minute, date_time)
-            prev_timefram_minute_list[chat_id][timeframe_minute] = date_time
-        indicator_bb = BollingerBands(close=data_frame["close"], window=20, window_dev=2)
-        indicator_stoch = StochasticOscillator(
-            close=data_frame["close"], high=data_frame["high"], low=data_frame["low"], window=14,
-            smooth_window=3)
-        indicator_stoch_rsi = StochRSIIndicator(
-            close=data_frame["close"], window=14, smooth1=3, smooth2=3)
-        indicator_rsi = RSIIndicator(close=data_frame["close"], window=14)
-        indicator_macd = MACD(
-            close=data_frame["close"], window_slow=26, window_fast=12, window_sign=9)
-        indicator_ema200 = EMAIndicator(close=data_frame["close"], window=200)
-
-        openday = data_frame['open'].iloc[0]
-        close = data_frame['close'].iloc[-1]
-        change_day = close - openday
-        change_day_perc = (change_day / openday) * 100
-        # Add Bollinger Bands features
-        data_frame['bb_bbm'] = indicator_bb.bollinger_mavg()
-        data_frame['bb_bbh'] = indicator_bb.bollinger_hband()
-        data_frame['bb_bbl'] = indicator_bb.bollinger_lband()
-        data_frame['bb_width'] = (
-            (data_frame['bb_bbh'] - data_frame['bb_bbl']) / data_frame['bb_bbm']) * 100
-        # Add Bollinger Band high indicator
-        data_frame['bb_bbhi'] = indicator_bb.bollinger_hband_indicator()
-        # Add Bollinger Band low indicator
-        data_frame['bb_bbli'] = indicator_bb.bollinger_lband_indicator()
-        bb_buy = bool(data_frame['bb_bbli'].iloc[-1])
-        bb_sell = bool(data_frame['bb_bbhi'].iloc[-1])
-
-        data_frame['stoch_signal'] = indicator_stoch.stoch_signal()
-        data_frame['stoch'] = indicator_stoch.stoch()
-        stoch_max = 80
-        stoch_min = 20
-        stoch_buy = \
-            data_frame['stoch_signal'].iloc[-1] < stoch_min and \
-            data_frame['stoch'].iloc[-1] < stoch_min
-        stoch_sell = \
-            data_frame['stoch_signal'].iloc[-1] > stoch_max and \
-            data_frame['stoch'].iloc[-1] > stoch_max
-
-        data_frame['stochRsiD'] = indicator_stoch_rsi.stochrsi_d() * 100
-        data_frame['stochRsiK'] = indicator_stoch_rsi.stochrsi_k() * 100
-        stoch_rsi_max = 80
-        stoch_rsi_min = 20
-        stoch_rsi_buy = \
-            data_frame['stochRsiD'].iloc[-1] < stoch_rsi_min and \
-            data_frame['stochRsiK'].iloc[-1] < stoch_rsi_min
-        stoch_rsi_sell = \
-            data_frame['stochRsiD'].iloc[-1] > stoch_rsi_max and \
-            data_frame['stochRsiK'].iloc[-1] > stoch_rsi_max
-
-        data_frame['rsi'] = indicator_rsi.rsi()
-        rsi_before = 5
-        rsi_max = 70
-        rsi_min = 30
-        rsi_buy = data_frame['rsi'].iloc[-1] < rsi_min + rsi_before
-        rsi_sell = data_frame['rsi'].iloc[-1] > rsi_max - rsi_before
-
-        data_frame['macdValue'] = indicator_macd.macd()
-        data_frame['macdSignal'] = indicator_macd.macd_signal()
-        data_frame['macdDiff'] = indicator_macd.macd_diff()
-
-        data_frame['ema200'] = indicator_ema200.ema_indicator()
-
-        data[pair] = {
-            "pair": pair,
-            "datetime": date_time, #df['timestamp'].iloc[-1],
-            "close": data_frame['close'].iloc[-1],
-            "quote_volume_m": quote_volume_m,
-            "change_day": change_day,
-            "change_day_perc": change_day_perc,
-            "high": data_frame['bb_bbh'].iloc[-1],
-            "low": data_frame['bb_bbl'].iloc[-1],
-            "bbWidth": data_frame['bb_width'].iloc[-1],
-            "stochD": data_frame['stoch_signal'].iloc[-1],
-            "stochK": data_frame['stoch'].iloc[-1],
-            "stochRsiD": data_frame['stochRsiD'].iloc[-1],
-            "stochRsiK": data_frame['stochRsiK'].iloc[-1],
-            "rsi": data_frame['rsi'].iloc[-1],
-            "macdValue": data_frame['macdValue'].iloc[-1],
-            "macdSignal": data_frame['macdSignal'].iloc[-1],
-            "macdDiff": data_frame['macdDiff'].iloc[-1],
-            "ema200": data_frame['ema200'].iloc[-1],
-            "bbBuy": bb_buy,
-            "stochBuy": stoch_buy,
-            "stochRsiBuy": stoch_rsi_buy,
-            "rsiBuy": rsi_buy,
-            "bbSell": bb_sell,
-            "stochSell": stoch_sell,
-            "stochRsiSell": stoch_rsi_sell,
-            "rsiSell": rsi_sell
-        }
-
-    buy_list = []
-    for _, value in data.items():
-        buy = True
-        for indicator in indicator_trigger_list:
-            index = f"{indicator}Buy"
-            assert index in value, f"Index {index} not in item {value}"
-            if not value[index]:
-                buy = False
-                continue
-        if buy:
-            buy_list.append(value)
-
-    sell_list = []
-    for _, value in data.items():
-        sell = True
-        for indicator in indicator_trigger_list:
-            index = f"{indicator}Sell"
-            assert index in value, f"Index {index} not in item {value}"
-            if not value[index]:
-                sell = False
-                continue
-        if sell:
-            sell_list.append(value)
-
-    signal_list = {
-        "Buy": buy_list,
-        "Sell": sell_list
-    }
-    return signal_list
+            last_timestamp = candle_buffer.last_timestamp()
+        return candle_buffer.get_candles()
 
-def fetch_ticker(pair):
-    """Fetch ticker"""
-    if EXCHANGE.symbols is None:
-        EXCHANGE.load_markets()
-    if pair in EXCHANGE.symbols:
+def get_source_timeframe(exchange_name, timeframe):
+    """Get timeframe of the candles fetched from the exchange for the candles of timeframe"""
+    if not RESAMPLE_TIMEFRAMES:
+        return timeframe
+    exchange = get_exchange(exchange_name)
+    base_seconds = exchange.parse_timeframe(RESAMPLE_BASE_TIMEFRAME)
+    seconds = exchange.parse_timeframe(timeframe)
+    if seconds > base_seconds and seconds % base_seconds == 0:
+        return RESAMPLE_BASE_TIMEFRAME
+    return timeframe
+
+async def fetch_resampled_candles(exchange_name, pair, timeframe, depth=None):
+    """Update candle buffer of pair with candles aggregated from the base timeframe"""
+    exchange = get_exchange(exchange_name)
+    timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+    base_depth = None
+    if depth is not None:
+        # Only the base candles since the open of the last closed candle of timeframe are needed
+        base_depth = (get_exchange_milliseconds(exchange.id) + timeframe_ms -
+                      get_current_candle_timestamp(exchange_name, timeframe)) // \
+            (exchange.parse_timeframe(RESAMPLE_BASE_TIMEFRAME) * 1000)
+    base_candles = await fetch_candles(exchange_name, pair, RESAMPLE_BASE_TIMEFRAME, base_depth)
+    if base_candles is None:
+        return None
+    candle_buffer = get_candle_buffer(exchange.id, pair, timeframe)
+    async with get_candle_lock(exchange.id, pair, timeframe):
+        current_timestamp = get_current_candle_timestamp(exchange_name, timeframe)
+        candles = resample_candles(base_candles, timeframe_ms)
+        candles = candles[candles[:, 0] < current_timestamp]
+        last_timestamp = candle_buffer.last_timestamp()
+        if last_timestamp is not None and len(candles) > 0 and \
+            candles[0, 0] <= last_timestamp + timeframe_ms and \
+            candle_buffer.depth >= candle_buffer.get_fill_depth(depth):
+            candle_buffer.append(candles)
+            return candle_buffer.get_candles()
+    # Not warmed up, not filled deep enough or the base candles do not reach the stored candles
+    return await fetch_candles(exchange_name, pair, timeframe, depth)
+
+async def fetch_pair_data(exchange_name, pair, timeframe, depth=None):
+    """Fetch ticker and closed candles of pair, at least depth candles when available"""
+    ticker = await fetch_ticker(exchange_name, pair)
+    if ticker is None:
+        return None
+    if get_source_timeframe(exchange_name, timeframe) != timeframe:
+        candles = await fetch_resampled_candles(exchange_name, pair, timeframe, depth)
+    else:
+        candles = await fetch_candles(exchange_name, pair, timeframe, depth)
+    if candles is None:
+        return None
+    candles = candles[candles[:, 0] < get_current_candle_timestamp(exchange_name, timeframe)]
+    if len(candles) == 0:
+        return None
+    return ticker, candles
+
+async def calculate_indicators(
+        exchange_name, timeframe, pair_data, indicator_trigger_lists=None):
+    """Calculate indicators of the last candle of each pair as a sequence per indicator, in batch
+    mode only of the pairs that can signal for one of the trigger lists"""
+    exchange_id = get_exchange(exchange_name).id
+    with INDICATOR_SECONDS.labels(exchange_id, timeframe).time():
+        if INDICATOR_MODE == "process":
+            return await calculate_indicators_parallel(
+                [candles for _, candles in pair_data.values()], indicator_trigger_lists)
+        if INDICATOR_MODE == "batch":
+            return calculate_indicators_batch(
+                [candles for _, candles in pair_data.values()], indicator_trigger_lists)
+        indicator_list = [update_indicator_state((exchange_id, pair, timeframe), candles)
+                          for pair, (_, candles) in pair_data.items()]
+        return {name: [indicator[name] for indicator in indicator_list]
+                for name in indicator_list[0]}
+
+async def scan_pairs(exchange_name, timeframe_minute, pairs, indicator_trigger_lists=None):
+    """Fetch candles of pairs in parallel and get their indicators and signals, the indicators
+    are calculated for the trigger lists of the chats, None for all indicators"""
+    timeframe = get_timeframe(timeframe_minute)
+    # Only as many candles as the indicators of the trigger lists need are fetched
+    depth = get_history_depth(indicator_trigger_lists)
+    results = await asyncio.gather(
+        *[fetch_pair_data(exchange_name, pair, timeframe, depth) for pair in pairs])
+    pair_data = {pair: result for pair, result in zip(pairs, results) if result is not None}
+    if len(pair_data) == 0:
+        return {}
+    indicators = await calculate_indicators(
+        exchange_name, timeframe, pair_data, indicator_trigger_lists)
+    with TRIGGER_SECONDS.labels(get_exchange(exchange_name).id, timeframe).time():
+        signal_table = SignalTable(
+            list(pair_data),
+            [candles[-1, 0] for _, candles in pair_data.values()],
+            [get_day_open(ticker) for ticker, _ in pair_data.values()],
+            [ticker["quoteVolume"] for ticker, _ in pair_data.values()],
+            indicators)
+    if STORE_HISTORY:
+        exchange = get_exchange(exchange_name)
+        # The candles are stored in the background once per scan of the pairs
+        store_history(exchange.id, timeframe, exchange.parse_timeframe(timeframe) * 1000,
+                      {pair: candles for pair, (_, candles) in pair_data.items()})
+    return signal_table.get_records()
+
+def get_market_group(exchange_name, pair):
+    """Get market type and sub type of pair, tickers are fetched per group"""
+    market = get_exchange(exchange_name).markets[pair]
+    sub_type = "linear" if market.get("linear") else "inverse" if market.get("inverse") else None
+    return market["type"], sub_type
+
+async def fetch_market_group_tickers(exchange_name, market_group, max_age, priority):
+    """Fetch tickers of market group, served from snapshot while not older than max_age"""
+    exchange = get_exchange(exchange_name)
+    key = (exchange.id,) + market_group
+    if key not in ticker_snapshot_locks:
+        ticker_snapshot_locks[key] = asyncio.Lock()
+    async with ticker_snapshot_locks[key]:
+        snapshot = ticker_snapshots.get(key)
+        if snapshot is not None and time.monotonic() - snapshot["time"] <= max_age:
+            return snapshot["tickers"]
+        market_type, sub_type = market_group
+        params = {"type": market_type}
+        if sub_type is not None:
+            params["subType"] = sub_type
         try:
-            return EXCHANGE.fetch_ticker(pair)
-        except ccxt.NetworkError:
-            print("Network error")
-    return None
+            with TICKER_FETCH_SECONDS.labels(exchange.id).time():
+                tickers = await request_exchange(
+                    exchange_name, "fetch_tickers", params=params, priority=priority)
+        except ccxt.BaseError as exception:
+            print(f"Error fetching {market_type} tickers: {type(exception).__name__} {exception}")
+            return {} if snapshot is None else snapshot["tickers"]
+        ticker_snapshots[key] = {"time": time.monotonic(), "tickers": tickers}
+        return tickers
+
+async def fetch_tickers(exchange_name, pairs, max_age=TICKER_SNAPSHOT_TTL,
+                        priority=PRIORITY_LIVE):
+    """Fetch tickers of pairs with one request per market group"""
+    markets = await load_markets(exchange_name)
+    pairs = [pair for pair in pairs if pair in markets]
+    market_groups = list(dict.fromkeys(get_market_group(exchange_name, pair) for pair in pairs))
+    tickers = {}
+    for market_group_tickers in await asyncio.gather(*[
+            fetch_market_group_tickers(exchange_name, group, max_age, priority)
+            for group in market_groups]):
+        tickers.update(market_group_tickers)
+    return {pair: tickers[pair] for pair in pairs if pair in tickers}
+
+def get_day_open(ticker):
+    """Get price of ticker 24 hours ago, derived from the change when the open is not given"""
+    if ticker.get("open") is not None:
+        return ticker["open"]
+    if ticker.get("percentage") is not None and ticker.get("last") is not None:
+        return ticker["last"] / (1 + ticker["percentage"] / 100)
+    return NAN
+
+async def fetch_ticker(exchange_name, pair):
+    """Fetch ticker"""
+    tickers = await fetch_tickers(exchange_name, [pair])
+    return tickers.get(pair)
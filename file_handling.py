@@ -11,18 +11,7 @@ FILENAMEBASECOIN = "./state/basecoin.json"
 FILENAMEPAIRLIST = "./state/pairlist.json"
 FILENAMEINDICATORTRIGGER = "./state/indicator_trigger.json"
 FILENAMETOOL = "./state/tool.json"
-
-def add_json(file_name, chat_id, value):
-    """Add json value of chat_id to file"""
-    json_dict = load_json(file_name)
-    json_dict[chat_id] += value
-    save_json(file_name, json_dict)
-
-def update_json(file_name, chat_id, value):
-    """Update json value of chat_id in file"""
-    json_dict = load_json(file_name)
-    json_dict[chat_id] = value
-    save_json(file_name, json_dict)
+FILENAMEMARKETS = "./state/markets_{}.json"
 
 def load_json(file_name):
     """Load json value of file"""
@@ -32,12 +21,26 @@ def load_json(file_name):
             value = json.load(file)
     return value
 
-def save_json(file_name, json_value):
+def save_json(file_name, json_value, sync=True):
     """Save json string to file"""
+    save_text(file_name, json.dumps(json_value), sync)
+
+def save_text(file_name, text, sync=True):
+    """Save text to file atomically, a crash leaves either the old or the new file, without sync
+    only a crash of the process and not of the system"""
     os.makedirs(os.path.dirname(file_name), exist_ok=True)
-    with open(file_name, 'w+', encoding="utf-8") as file:
-        json.dump(json_value, file)
+    temp_file_name = file_name + ".tmp"
+    with open(temp_file_name, 'w', encoding="utf-8") as file:
+        file.write(text)
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(temp_file_name, file_name)
 
 def file_exists(file_name):
     """Check if file exists"""
     return os.path.isfile(file_name)
+
+def get_modification_time(file_name):
+    """Get modification time of file in nanoseconds, None when it does not exist"""
+    return os.stat(file_name).st_mtime_ns if os.path.isfile(file_name) else None
@@ -0,0 +1,240 @@
+"""History handling, stores closed candles on disk per exchange, pair and timeframe"""
+import asyncio
+import contextlib
+import fcntl
+import os
+import numpy as np
+
+from file_handling import load_json, save_json, get_modification_time
+from candle_handling import CANDLE_COLUMNS
+
+# Store the closed candles of the scanned pairs, restarts and backtests read them from disk
+STORE_HISTORY = True
+HISTORY_DIRECTORY = "./history"
+# Number of candles per chunk file of a column
+HISTORY_CHUNK_SIZE = 65536
+
+candle_stores = {}
+candle_store_locks = {}
+# Appends of the scanned candles running in the background
+history_tasks = set()
+
+class CandleStore:
+    """Append only columnar store of candles, one memory mapped file per column and chunk"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta_file_name = os.path.join(directory, "meta.json")
+        self.lock_file_name = os.path.join(directory, "lock")
+        self.load_meta()
+
+    def load_meta(self):
+        """Load meta data of the store, empty when not stored yet"""
+        self.meta_time = get_modification_time(self.meta_file_name)
+        self.meta = load_json(self.meta_file_name)
+        if "count" not in self.meta:
+            self.meta = get_empty_meta()
+        self.chunk_size = self.meta["chunk_size"]
+
+    def refresh_meta(self):
+        """Load meta data again when another process changed the store, the bot and backtests
+        append to the same stores"""
+        if get_modification_time(self.meta_file_name) != self.meta_time:
+            self.load_meta()
+
+    def save_meta(self):
+        """Save meta data of the store, not synced to disk like the memory mapped chunks"""
+        save_json(self.meta_file_name, self.meta, sync=False)
+        self.meta_time = get_modification_time(self.meta_file_name)
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Lock the store against writes of other processes, the bot and backtests append to the
+        same stores"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_file_name, "a", encoding="utf-8") as lock_file:
+            # Released when the file is closed
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def get_chunk(self, index):
+        """Get memory mapped columns of chunk, created when new"""
+        # Chunks are mapped per access, every mapping holds a file descriptor while referenced
+        chunk = {}
+        for column in CANDLE_COLUMNS:
+            file_name = os.path.join(self.directory, f"{column}_{index:06d}.npy")
+            if os.path.isfile(file_name):
+                chunk[column] = np.load(file_name, mmap_mode="r+")
+            else:
+                os.makedirs(self.directory, exist_ok=True)
+                chunk[column] = np.lib.format.open_memmap(
+                    file_name, mode="w+", dtype=float, shape=(self.chunk_size,))
+        return chunk
+
+    def get_chunk_rows(self, index):
+        """Get number of stored candles in chunk"""
+        return min(self.chunk_size, self.meta["count"] - index * self.chunk_size)
+
+    def last_timestamp(self):
+        """Get timestamp of last stored candle"""
+        return self.meta["last_timestamp"]
+
+    def get_start(self):
+        """Get timestamp from which the stored history is complete, None when empty"""
+        if self.meta["start"] is None and self.meta["count"] > 0:
+            # Gaps before the last candle are unknown without start
+            return self.meta["last_timestamp"]
+        return self.meta["start"]
+
+    def append(self, bars, timeframe_ms=None):
+        """Append candles newer than the last stored candle"""
+        if len(bars) == 0:
+            return
+        with self.lock():
+            self.refresh_meta()
+            self.append_rows(bars, timeframe_ms)
+            self.save_meta()
+
+    def append_rows(self, bars, timeframe_ms):
+        """Write candles newer than the last stored candle, meta data saved by the caller"""
+        bars = np.asarray(bars, dtype=float)[:, :len(CANDLE_COLUMNS)]
+        bars = bars[np.argsort(bars[:, 0], kind="stable")]
+        bars = bars[np.append(bars[1:, 0] != bars[:-1, 0], True)]
+        last_timestamp = self.last_timestamp()
+        if last_timestamp is None:
+            # The history is complete from the first appended candle
+            self.meta["start"] = float(bars[0, 0])
+        else:
+            bars = bars[bars[:, 0] > last_timestamp]
+            if len(bars) == 0:
+                return
+            if timeframe_ms is not None and bars[0, 0] > last_timestamp + timeframe_ms:
+                # Candles are missing, the history is complete from the appended candles only
+                self.meta["start"] = float(bars[0, 0])
+        while len(bars) > 0:
+            index = self.meta["count"] // self.chunk_size
+            row = self.meta["count"] % self.chunk_size
+            rows = min(len(bars), self.chunk_size - row)
+            chunk = self.get_chunk(index)
+            # The written pages of the mapping are written back by the system, not flushed
+            for column_index, column in enumerate(CANDLE_COLUMNS):
+                chunk[column][row:row + rows] = bars[:rows, column_index]
+            if row == 0:
+                self.meta["first_timestamps"].append(float(bars[0, 0]))
+            self.meta["count"] += rows
+            self.meta["last_timestamp"] = int(bars[rows - 1, 0])
+            bars = bars[rows:]
+
+    def read_columns(self, since=None, until=None):
+        """Get columns of the candles from since till before until, views when in one chunk"""
+        first_timestamps = self.meta["first_timestamps"]
+        first_index = 0 if since is None else \
+            max(0, int(np.searchsorted(first_timestamps, since, side="right")) - 1)
+        last_index = len(first_timestamps) - 1 if until is None else \
+            int(np.searchsorted(first_timestamps, until, side="left")) - 1
+        parts = []
+        for index in range(first_index, last_index + 1):
+            chunk = self.get_chunk(index)
+            rows = self.get_chunk_rows(index)
+            timestamps = chunk["timestamp"][:rows]
+            start = 0 if since is None else int(np.searchsorted(timestamps, since, side="left"))
+            end = rows if until is None else int(np.searchsorted(timestamps, until, side="left"))
+            if end > start:
+                parts.append({column: chunk[column][start:end] for column in CANDLE_COLUMNS})
+        if len(parts) == 0:
+            return {column: np.empty(0) for column in CANDLE_COLUMNS}
+        if len(parts) == 1:
+            return parts[0]
+        return {column: np.concatenate([part[column] for part in parts])
+                for column in CANDLE_COLUMNS}
+
+    def read(self, since=None, until=None):
+        """Get candles from since till before until as rows of the candle columns"""
+        columns = self.read_columns(since, until)
+        return np.column_stack([columns[column] for column in CANDLE_COLUMNS])
+
+    def read_last(self, count):
+        """Get the last count candles, only those from the start of the complete history"""
+        self.refresh_meta()
+        count = min(count, self.meta["count"])
+        if count == 0:
+            return np.empty((0, len(CANDLE_COLUMNS)))
+        candles = []
+        remaining = count
+        index = (self.meta["count"] - 1) // self.chunk_size
+        while remaining > 0:
+            chunk = self.get_chunk(index)
+            rows = self.get_chunk_rows(index)
+            start = max(0, rows - remaining)
+            candles.insert(0, np.column_stack(
+                [chunk[column][start:rows] for column in CANDLE_COLUMNS]))
+            remaining -= rows - start
+            index -= 1
+        candles = np.concatenate(candles)
+        # Candles before a gap would leave it in the candle buffer
+        return candles[candles[:, 0] >= self.get_start()]
+
+    def set_start(self, start):
+        """Set timestamp from which the history is complete"""
+        with self.lock():
+            self.refresh_meta()
+            self.meta["start"] = start
+            self.save_meta()
+
+def get_empty_meta():
+    """Get meta data of a store without candles"""
+    return {"chunk_size": HISTORY_CHUNK_SIZE, "count": 0, "start": None,
+            "last_timestamp": None, "first_timestamps": []}
+
+def get_history_directory(exchange_id, pair, timeframe):
+    """Get directory of the stored candles of exchange, pair and timeframe"""
+    pair_name = pair.replace("/", "_").replace(":", "_")
+    return os.path.join(HISTORY_DIRECTORY, exchange_id, pair_name, timeframe)
+
+def get_candle_store(exchange_id, pair, timeframe):
+    """Get candle store of exchange, pair and timeframe"""
+    key = (exchange_id, pair, timeframe)
+    if key not in candle_stores:
+        candle_stores[key] = CandleStore(get_history_directory(exchange_id, pair, timeframe))
+    return candle_stores[key]
+
+def get_candle_store_lock(exchange_id, pair, timeframe):
+    """Get lock preventing concurrent access of the same candle store"""
+    key = (exchange_id, pair, timeframe)
+    if key not in candle_store_locks:
+        candle_store_locks[key] = asyncio.Lock()
+    return candle_store_locks[key]
+
+async def append_history(exchange_id, pair, timeframe, timeframe_ms, candles):
+    """Append closed candles to the store without blocking the event loop"""
+    async with get_candle_store_lock(exchange_id, pair, timeframe):
+        store = await asyncio.to_thread(get_candle_store, exchange_id, pair, timeframe)
+        await asyncio.to_thread(store.append, candles, timeframe_ms)
+
+async def append_histories(exchange_id, timeframe, timeframe_ms, pair_candles):
+    """Append closed candles of each pair to its store"""
+    try:
+        for pair, candles in pair_candles.items():
+            await append_history(exchange_id, pair, timeframe, timeframe_ms, candles)
+    except OSError as exception:
+        print(f"Error storing candles of {exchange_id} {timeframe}: {exception}")
+
+def store_history(exchange_id, timeframe, timeframe_ms, pair_candles):
+    """Append closed candles of each pair to its store in the background, off the scan"""
+    task = asyncio.create_task(
+        append_histories(exchange_id, timeframe, timeframe_ms, pair_candles))
+    history_tasks.add(task)
+    task.add_done_callback(history_tasks.discard)
+
+async def close_history():
+    """Wait till the candles appended in the background are stored"""
+    await asyncio.gather(*history_tasks)
+
+async def load_history(exchange_id, pair, timeframe, count):
+    """Get the last count stored candles without blocking the event loop"""
+    async with get_candle_store_lock(exchange_id, pair, timeframe):
+        store = await asyncio.to_thread(get_candle_store, exchange_id, pair, timeframe)
+        return await asyncio.to_thread(store.read_last, count)
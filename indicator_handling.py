@@ -0,0 +1,528 @@
+"""Indicator handling with incremental indicator state per candle series"""
+import asyncio
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+import numpy as np
+
+from candle_handling import CANDLE_COLUMNS
+
+NAN = float("nan")
+
+# Number of bars of which the exponential moving averages are calculated at once
+EWM_BLOCK_SIZE = 64
+
+# Worker processes calculating the indicators in parallel, one per core by default
+INDICATOR_WORKERS = os.cpu_count() or 1
+# Number of pairs per task of a worker, None divides the pairs evenly over the workers
+INDICATOR_CHUNK_SIZE = None
+# Fewer pairs are calculated in the bot process, passing them to the workers costs more, below
+# the number of pairs of a scan chunk so the chunks of a scan are calculated by the workers
+INDICATOR_WORKER_MIN_PAIRS = 20
+# Candle columns the indicators are calculated from, shared with the workers
+INDICATOR_COLUMNS = ["high", "low", "close"]
+# Indicators of the last candle of a pair
+INDICATOR_NAMES = [
+    "close", "bb_bbm", "bb_bbh", "bb_bbl", "bb_bbhi", "bb_bbli", "stoch", "stoch_signal", "rsi",
+    "stochrsi_k", "stochrsi_d", "macd", "macd_signal", "macd_diff", "ema200"]
+
+indicator_pool = None
+
+# Boundaries of the indicator signals
+STOCH_MIN = 20
+STOCH_MAX = 80
+STOCH_RSI_MIN = 20
+STOCH_RSI_MAX = 80
+RSI_MIN = 30
+RSI_MAX = 70
+# RSI signals are given this much before the RSI reaches its boundary
+RSI_BEFORE = 5
+# Triggers evaluated cheapest first, the RSI averages over all bars instead of a window
+TRIGGER_ORDER = ["bb", "stoch", "rsi", "stochRsi"]
+
+# Weight the candles before the fetched candles may keep in an exponential average, lower is
+# more accurate and fetches more candles, 0 fetches the whole candle buffer
+WARMUP_TOLERANCE = 0.01
+# Indicators shown in every signal, fetched deep enough besides the triggers of the chats,
+# without "ema200" only its one-time backfill is shallower and the EMA200 is less accurate
+DISPLAY_INDICATORS = ["bb", "stoch", "stochRsi", "rsi", "macd", "ema200"]
+
+indicator_states = {}
+
+def divide(numerator, denominator):
+    """Divide, nan when denominator is zero"""
+    return numerator / denominator if denominator != 0 else NAN
+
+class ExponentialAverage:
+    """Exponential moving average, equal to pandas ewm with adjust=False"""
+
+    def __init__(self, alpha, min_periods):
+        self.alpha = alpha
+        self.min_periods = min_periods
+        self.average = NAN
+        self.count = 0
+
+    def update(self, value):
+        """Add value and get average"""
+        if not math.isnan(value):
+            if self.count == 0:
+                self.average = value
+            else:
+                self.average += self.alpha * (value - self.average)
+            self.count += 1
+        return self.get()
+
+    def get(self):
+        """Get average, nan till min_periods values are added"""
+        return self.average if self.count >= self.min_periods else NAN
+
+class RollingWindow:
+    """Window of the last values, equal to pandas rolling with min_periods=window"""
+
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+        self.nan_count = 0
+
+    def update(self, value):
+        """Add value and remove the oldest value when the window is full"""
+        if len(self.values) == self.values.maxlen and math.isnan(self.values[0]):
+            self.nan_count -= 1
+        if math.isnan(value):
+            self.nan_count += 1
+        self.values.append(value)
+
+    def is_valid(self):
+        """Check if window is full without nan values"""
+        return len(self.values) == self.values.maxlen and self.nan_count == 0
+
+    def mean(self):
+        """Get mean of window"""
+        return sum(self.values) / len(self.values) if self.is_valid() else NAN
+
+    def std(self):
+        """Get population standard deviation of window"""
+        if not self.is_valid():
+            return NAN
+        mean = self.mean()
+        return math.sqrt(sum((x - mean) ** 2 for x in self.values) / len(self.values))
+
+    def min(self):
+        """Get minimum of window"""
+        return min(self.values) if self.is_valid() else NAN
+
+    def max(self):
+        """Get maximum of window"""
+        return max(self.values) if self.is_valid() else NAN
+
+class IndicatorState:
+    """Running state of the indicators of one candle series, updated per closed candle"""
+
+    def __init__(self):
+        self.timestamp = None
+        self.prev_close = NAN
+        # Bollinger Bands window 20, deviation 2
+        self.bb_close = RollingWindow(20)
+        # Stochastic window 14, smooth window 3
+        self.stoch_high = RollingWindow(14)
+        self.stoch_low = RollingWindow(14)
+        self.stoch_k = RollingWindow(3)
+        # RSI window 14
+        self.rsi_up = ExponentialAverage(1 / 14, 14)
+        self.rsi_down = ExponentialAverage(1 / 14, 14)
+        # Stochastic RSI window 14, smooth1 3, smooth2 3
+        self.stoch_rsi_rsi = RollingWindow(14)
+        self.stoch_rsi = RollingWindow(3)
+        self.stoch_rsi_k = RollingWindow(3)
+        # MACD slow 26, fast 12, signal 9
+        self.macd_fast = ExponentialAverage(2 / 13, 12)
+        self.macd_slow = ExponentialAverage(2 / 27, 26)
+        self.macd_signal = ExponentialAverage(2 / 10, 9)
+        # EMA window 200
+        self.ema200 = ExponentialAverage(2 / 201, 200)
+        self.values = {}
+
+    def update(self, timestamp, high, low, close):
+        """Update indicators with closed candle"""
+        self.timestamp = timestamp
+
+        self.bb_close.update(close)
+        bb_bbm = self.bb_close.mean()
+        bb_std = self.bb_close.std()
+        bb_bbh = bb_bbm + 2 * bb_std
+        bb_bbl = bb_bbm - 2 * bb_std
+
+        self.stoch_high.update(high)
+        self.stoch_low.update(low)
+        stoch_min = self.stoch_low.min()
+        stoch = 100 * divide(close - stoch_min, self.stoch_high.max() - stoch_min)
+        self.stoch_k.update(stoch)
+
+        diff = close - self.prev_close if not math.isnan(self.prev_close) else 0.0
+        self.prev_close = close
+        rsi_up = self.rsi_up.update(max(diff, 0.0))
+        rsi_down = self.rsi_down.update(max(-diff, 0.0))
+        if rsi_down == 0:
+            rsi = 100.0
+        else:
+            rsi = 100 - (100 / (1 + rsi_up / rsi_down))
+
+        self.stoch_rsi_rsi.update(rsi)
+        rsi_min = self.stoch_rsi_rsi.min()
+        self.stoch_rsi.update(divide(rsi - rsi_min, self.stoch_rsi_rsi.max() - rsi_min))
+        stoch_rsi_k = self.stoch_rsi.mean()
+        self.stoch_rsi_k.update(stoch_rsi_k)
+
+        macd = self.macd_fast.update(close) - self.macd_slow.update(close)
+        macd_signal = self.macd_signal.update(macd)
+
+        self.values = {
+            "close": close,
+            "bb_bbm": bb_bbm,
+            "bb_bbh": bb_bbh,
+            "bb_bbl": bb_bbl,
+            "bb_bbhi": 1.0 if close > bb_bbh else 0.0,
+            "bb_bbli": 1.0 if close < bb_bbl else 0.0,
+            "stoch": stoch,
+            "stoch_signal": self.stoch_k.mean(),
+            "rsi": rsi,
+            "stochrsi_k": stoch_rsi_k,
+            "stochrsi_d": self.stoch_rsi_k.mean(),
+            "macd": macd,
+            "macd_signal": macd_signal,
+            "macd_diff": macd - macd_signal,
+            "ema200": self.ema200.update(close),
+        }
+
+def update_indicator_state(key, candles):
+    """Update indicator state of candle series with the candles not processed yet"""
+    state = indicator_states.get(key)
+    if state is None or state.timestamp is None or state.timestamp < candles[0, 0]:
+        # New series or gap with the candles, calculate from the first candle
+        state = IndicatorState()
+        indicator_states[key] = state
+    else:
+        candles = candles[candles[:, 0] > state.timestamp]
+    for timestamp, _, high, low, close, _ in candles:
+        state.update(timestamp, high, low, close)
+    return state.values
+
+def get_bb_triggers(indicator):
+    """Get buy and sell trigger of the Bollinger Bands"""
+    return indicator['bb_bbli'] != 0, indicator['bb_bbhi'] != 0
+
+def get_stoch_triggers(indicator):
+    """Get buy and sell trigger of the Stochastic"""
+    return (
+        (indicator['stoch_signal'] < STOCH_MIN) & (indicator['stoch'] < STOCH_MIN),
+        (indicator['stoch_signal'] > STOCH_MAX) & (indicator['stoch'] > STOCH_MAX))
+
+def get_stoch_rsi_triggers(indicator):
+    """Get buy and sell trigger of the Stochastic RSI"""
+    stoch_rsi_d = indicator['stochrsi_d'] * 100
+    stoch_rsi_k = indicator['stochrsi_k'] * 100
+    return (
+        (stoch_rsi_d < STOCH_RSI_MIN) & (stoch_rsi_k < STOCH_RSI_MIN),
+        (stoch_rsi_d > STOCH_RSI_MAX) & (stoch_rsi_k > STOCH_RSI_MAX))
+
+def get_rsi_triggers(indicator):
+    """Get buy and sell trigger of the RSI"""
+    return indicator['rsi'] < RSI_MIN + RSI_BEFORE, indicator['rsi'] > RSI_MAX - RSI_BEFORE
+
+signal_triggers = {
+    "bb": get_bb_triggers,
+    "stoch": get_stoch_triggers,
+    "stochRsi": get_stoch_rsi_triggers,
+    "rsi": get_rsi_triggers
+}
+
+def get_signal_triggers(indicator):
+    """Get buy and sell triggers of indicators, of one candle or of arrays of candles"""
+    triggers = {name: get_triggers(indicator) for name, get_triggers in signal_triggers.items()}
+    return {
+        **{f"{name}Buy": buy for name, (buy, _) in triggers.items()},
+        **{f"{name}Sell": sell for name, (_, sell) in triggers.items()}
+    }
+
+def get_ewm_warmup(alpha, min_periods):
+    """Get number of bars after which the bars before weigh less than the warm-up tolerance in
+    an exponential average"""
+    if WARMUP_TOLERANCE <= 0:
+        return min_periods
+    return max(min_periods, math.ceil(math.log(WARMUP_TOLERANCE) / math.log(1 - alpha)))
+
+def get_warmup_bars(indicator):
+    """Get number of closed candles indicator needs for a stable value of the last candle"""
+    rsi = 1 + get_ewm_warmup(1 / 14, 14)
+    warmup_bars = {
+        "bb": 20,
+        "stoch": 14 + 3 - 1,
+        "rsi": rsi,
+        "stochRsi": rsi + 14 - 1 + 3 - 1 + 3 - 1,
+        "macd": get_ewm_warmup(2 / 27, 26) + get_ewm_warmup(2 / 10, 9) - 1,
+        "ema200": get_ewm_warmup(2 / 201, 200)
+    }
+    return warmup_bars[indicator]
+
+def get_history_depth(indicator_trigger_lists=None):
+    """Get number of closed candles to fetch for the trigger lists and the displayed indicators,
+    None for the whole candle buffer"""
+    if indicator_trigger_lists is None or WARMUP_TOLERANCE <= 0:
+        return None
+    indicators = set(DISPLAY_INDICATORS).union(*indicator_trigger_lists)
+    return max(get_warmup_bars(indicator) for indicator in indicators)
+
+def stack_candles(candle_list, columns=None, matrix=None):
+    """Stack candles of pairs into a pairs x bars matrix per column, padded left with nan"""
+    columns = CANDLE_COLUMNS if columns is None else columns
+    column_indices = [CANDLE_COLUMNS.index(column) for column in columns]
+    bars = max(len(candles) for candles in candle_list)
+    if matrix is None:
+        matrix = np.empty((len(columns), len(candle_list), bars))
+    matrix.fill(NAN)
+    for index, candles in enumerate(candle_list):
+        matrix[:, index, bars - len(candles):] = candles[:, column_indices].T
+    return dict(zip(columns, matrix))
+
+def ewm_matrix(values, alpha, min_periods):
+    """Exponential moving average along the bars, equal to pandas ewm with adjust=False"""
+    valid = ~np.isnan(values)
+    first = np.argmax(valid, axis=1)
+    has_valid = valid.any(axis=1)
+    if not np.array_equal(
+            valid, has_valid[:, None] & (np.arange(values.shape[1]) >= first[:, None])):
+        # Nan values after the first value, average bar by bar
+        return ewm_matrix_loop(values, alpha, min_periods)
+    # Pad the leading nan values with the first value, so the average starts at the first value
+    first_values = values[np.arange(values.shape[0]), first]
+    average = ewm_blocks(np.where(valid, values, first_values[:, None]), alpha)
+    return np.where(np.cumsum(valid, axis=1) >= min_periods, average, NAN)
+
+def ewm_blocks(values, alpha):
+    """Exponential moving average starting at the first value, in blocks of bars at once"""
+    pairs, bars = values.shape
+    if bars == 0:
+        return values.copy()
+    block_size = EWM_BLOCK_SIZE
+    blocks = -(-bars // block_size)
+    blocked = np.zeros((pairs, blocks * block_size))
+    blocked[:, :bars] = values
+    blocked = blocked.reshape(pairs, blocks, block_size)
+    # Average in a block is the weighted block values plus the decayed average before the block
+    decay = (1 - alpha) ** np.arange(1, block_size + 1)
+    row, column = np.indices((block_size, block_size))
+    weights = np.where(row >= column, alpha * (1 - alpha) ** (row - column), 0.0)
+    local = blocked @ weights.T
+    carry = np.empty((pairs, blocks))
+    previous = values[:, 0]
+    for index in range(blocks):
+        carry[:, index] = previous
+        previous = local[:, index, -1] + decay[-1] * previous
+    return (local + carry[:, :, None] * decay).reshape(pairs, -1)[:, :bars]
+
+def ewm_matrix_loop(values, alpha, min_periods):
+    """Exponential moving average along the bars bar by bar, skipping nan values"""
+    result = np.full(values.shape, NAN)
+    average = np.full(values.shape[0], NAN)
+    count = np.zeros(values.shape[0])
+    for index in range(values.shape[1]):
+        column = values[:, index]
+        valid = ~np.isnan(column)
+        average = np.where(
+            valid, np.where(count == 0, column, average + alpha * (column - average)), average)
+        count += valid
+        result[:, index] = np.where(count >= min_periods, average, NAN)
+    return result
+
+def rolling_matrix(values, window, function):
+    """Rolling window function along the bars, nan till the window is full without nan"""
+    result = np.full(values.shape, NAN)
+    if values.shape[1] >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=1)
+        result[:, window - 1:] = function(windows, axis=2)
+    return result
+
+def bollinger_matrix(close):
+    """Bollinger Bands window 20, deviation 2 over pairs x bars matrices"""
+    bb_bbm = rolling_matrix(close, 20, np.mean)
+    bb_std = rolling_matrix(close, 20, np.std)
+    bb_bbh = bb_bbm + 2 * bb_std
+    bb_bbl = bb_bbm - 2 * bb_std
+    return {
+        "close": close,
+        "bb_bbm": bb_bbm,
+        "bb_bbh": bb_bbh,
+        "bb_bbl": bb_bbl,
+        "bb_bbhi": np.where(close > bb_bbh, 1.0, 0.0),
+        "bb_bbli": np.where(close < bb_bbl, 1.0, 0.0),
+    }
+
+def stoch_matrix(high, low, close):
+    """Stochastic window 14, smooth window 3 over pairs x bars matrices"""
+    stoch_min = rolling_matrix(low, 14, np.min)
+    stoch = 100 * (close - stoch_min) / (rolling_matrix(high, 14, np.max) - stoch_min)
+    return {"stoch": stoch, "stoch_signal": rolling_matrix(stoch, 3, np.mean)}
+
+def rsi_matrix(close):
+    """RSI window 14 over pairs x bars matrices, the first candle of a pair has no change"""
+    diff = close - np.concatenate((np.full((close.shape[0], 1), NAN), close[:, :-1]), axis=1)
+    diff = np.where(np.isnan(diff) & ~np.isnan(close), 0.0, diff)
+    no_change = np.where(np.isnan(diff), NAN, 0.0)
+    rsi_up = ewm_matrix(np.where(diff > 0, diff, no_change), 1 / 14, 14)
+    rsi_down = ewm_matrix(np.where(diff < 0, -diff, no_change), 1 / 14, 14)
+    return {"rsi": np.where(rsi_down == 0, 100, 100 - (100 / (1 + rsi_up / rsi_down)))}
+
+def stoch_rsi_matrix(close):
+    """Stochastic RSI window 14, smooth1 3, smooth2 3 over pairs x bars matrices"""
+    rsi = rsi_matrix(close)["rsi"]
+    rsi_min = rolling_matrix(rsi, 14, np.min)
+    stoch_rsi = (rsi - rsi_min) / (rolling_matrix(rsi, 14, np.max) - rsi_min)
+    stoch_rsi_k = rolling_matrix(stoch_rsi, 3, np.mean)
+    return {
+        "rsi": rsi,
+        "stochrsi_k": stoch_rsi_k,
+        "stochrsi_d": rolling_matrix(stoch_rsi_k, 3, np.mean),
+    }
+
+def calculate_indicators_matrix(high, low, close):
+    """Calculate indicators of all pairs at once over pairs x bars matrices"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # MACD slow 26, fast 12, signal 9
+        macd = ewm_matrix(close, 2 / 13, 12) - ewm_matrix(close, 2 / 27, 26)
+        macd_signal = ewm_matrix(macd, 2 / 10, 9)
+
+        return {
+            **bollinger_matrix(close),
+            **stoch_matrix(high, low, close),
+            **stoch_rsi_matrix(close),
+            "macd": macd,
+            "macd_signal": macd_signal,
+            "macd_diff": macd - macd_signal,
+            "ema200": ewm_matrix(close, 2 / 201, 200),
+        }
+
+# Indicators of each trigger and the number of last bars they are calculated from, None for all
+trigger_indicators = {
+    "bb": lambda high, low, close: bollinger_matrix(close),
+    "stoch": stoch_matrix,
+    "rsi": lambda high, low, close: rsi_matrix(close),
+    "stochRsi": lambda high, low, close: stoch_rsi_matrix(close)
+}
+trigger_bars = {"bb": 20, "stoch": 14 + 3 - 1, "rsi": None, "stochRsi": None}
+
+def calculate_trigger_indicators(indicator, high, low, close):
+    """Calculate indicators of the last candle the trigger of indicator depends on"""
+    bars = trigger_bars[indicator]
+    if bars is not None:
+        # Only the windows ending at the last candle are needed
+        high, low, close = high[:, -bars:], low[:, -bars:], close[:, -bars:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        indicator_matrix = trigger_indicators[indicator](high, low, close)
+    return {name: values[:, -1] for name, values in indicator_matrix.items()}
+
+def get_signalling_pairs(high, low, close, indicator_trigger_lists):
+    """Get pairs of which all triggers of a trigger list can give a buy or sell signal, the
+    triggers are evaluated cheapest first on the pairs not dropped yet"""
+    count = close.shape[0]
+    signalling = np.ones(count, dtype=bool)
+    buy = [np.ones(count, dtype=bool) for _ in indicator_trigger_lists]
+    sell = [np.ones(count, dtype=bool) for _ in indicator_trigger_lists]
+    for indicator in TRIGGER_ORDER:
+        trigger_list_indices = [index for index, indicator_trigger_list
+                                in enumerate(indicator_trigger_lists)
+                                if indicator in indicator_trigger_list]
+        rows = np.flatnonzero(signalling)
+        if len(trigger_list_indices) == 0 or len(rows) == 0:
+            continue
+        indicator_buy, indicator_sell = signal_triggers[indicator](
+            calculate_trigger_indicators(indicator, high[rows], low[rows], close[rows]))
+        for index in trigger_list_indices:
+            buy[index][rows] &= indicator_buy
+            sell[index][rows] &= indicator_sell
+        signalling = np.logical_or.reduce(buy + sell)
+    return signalling
+
+def get_last_values(high, low, close, indicator_trigger_lists=None):
+    """Get indicators of the last candle of pairs x bars matrices as an array per indicator,
+    only of the pairs that can signal for one of the trigger lists, nan for the other pairs"""
+    if indicator_trigger_lists is None or \
+        any(len(indicator_trigger_list) == 0 for indicator_trigger_list in indicator_trigger_lists):
+        indicator_matrix = calculate_indicators_matrix(high, low, close)
+        return {name: values[:, -1].copy() for name, values in indicator_matrix.items()}
+    rows = np.flatnonzero(get_signalling_pairs(high, low, close, indicator_trigger_lists))
+    last_values = {name: np.full(close.shape[0], NAN) for name in INDICATOR_NAMES}
+    last_values["bb_bbhi"][:] = last_values["bb_bbli"][:] = 0.0
+    last_values["close"] = close[:, -1].copy()
+    if len(rows) > 0:
+        # The values only displayed with a signal are calculated for the signalling pairs
+        indicator_matrix = calculate_indicators_matrix(high[rows], low[rows], close[rows])
+        for name, values in indicator_matrix.items():
+            last_values[name][rows] = values[:, -1]
+    return last_values
+
+def join_last_values(last_values_list):
+    """Join arrays per indicator of groups of pairs into arrays per indicator of all pairs"""
+    return {name: np.concatenate([last_values[name] for last_values in last_values_list])
+            for name in last_values_list[0]}
+
+def calculate_indicators_batch(candle_list, indicator_trigger_lists=None):
+    """Calculate indicators of the last candle of all pairs at once as arrays per indicator"""
+    if len(candle_list) == 0:
+        return {}
+    matrix = stack_candles(candle_list, INDICATOR_COLUMNS)
+    return get_last_values(
+        matrix["high"], matrix["low"], matrix["close"], indicator_trigger_lists)
+
+def get_indicator_pool():
+    """Get the pool of worker processes, started on first use"""
+    global indicator_pool
+    if indicator_pool is None:
+        # Spawned workers do not inherit the threads and the event loop of the bot
+        indicator_pool = ProcessPoolExecutor(INDICATOR_WORKERS, mp_context=get_context("spawn"))
+    return indicator_pool
+
+def calculate_indicators_chunk(name, shape, start, end, indicator_trigger_lists=None):
+    """Calculate indicators of the pairs start till end of the candles in shared memory"""
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        return get_last_values(
+            *np.ndarray(shape, buffer=memory.buf)[:, start:end], indicator_trigger_lists)
+    finally:
+        memory.close()
+
+def get_chunk_size(count):
+    """Get number of pairs per task of a worker"""
+    if INDICATOR_CHUNK_SIZE is not None:
+        return INDICATOR_CHUNK_SIZE
+    return max(1, -(-count // INDICATOR_WORKERS))
+
+async def calculate_indicators_parallel(candle_list, indicator_trigger_lists=None):
+    """Calculate indicators of the last candle of all pairs in chunks on the worker processes,
+    as arrays per indicator"""
+    if len(candle_list) < INDICATOR_WORKER_MIN_PAIRS:
+        return calculate_indicators_batch(candle_list, indicator_trigger_lists)
+    count = len(candle_list)
+    shape = (len(INDICATOR_COLUMNS), count, max(len(candles) for candles in candle_list))
+    # The candles are passed to the workers in shared memory instead of pickled
+    memory = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        stack_candles(candle_list, INDICATOR_COLUMNS, np.ndarray(shape, buffer=memory.buf))
+        loop = asyncio.get_running_loop()
+        chunk_size = get_chunk_size(count)
+        chunks = await asyncio.gather(*[
+            loop.run_in_executor(
+                get_indicator_pool(), calculate_indicators_chunk, memory.name, shape, start,
+                min(start + chunk_size, count), indicator_trigger_lists)
+            for start in range(0, count, chunk_size)])
+    finally:
+        memory.close()
+        memory.unlink()
+    return join_last_values(chunks)
+
+def close_indicator_pool():
+    """Stop the worker processes"""
+    global indicator_pool
+    if indicator_pool is not None:
+        indicator_pool.shutdown(wait=False, cancel_futures=True)
+        indicator_pool = None
@@ -0,0 +1,210 @@
+"""Message handling, sends all bot output through one rate limited queue"""
+import asyncio
+import itertools
+import time
+from functools import partial
+
+from telegram.error import NetworkError, RetryAfter, TelegramError
+
+from metrics_handling import SEND_SECONDS, MESSAGES, get_chat_label
+
+# Telegram allows about 30 messages per second in total and 1 message per second per chat
+GLOBAL_MESSAGE_RATE = 30
+GLOBAL_MESSAGE_BURST = 30
+CHAT_MESSAGE_RATE = 1
+CHAT_MESSAGE_BURST = 3
+# Retries of a message after a network error, the delay doubles per retry
+MAX_SEND_RETRIES = 5
+SEND_RETRY_DELAY = 1
+# Seconds pending messages are still sent on shutdown
+CLOSE_TIMEOUT = 10
+
+# Lower is sent first, progress edits wait for signals and replies
+PRIORITY_SIGNAL = 0
+PRIORITY_REPLY = 1
+PRIORITY_PROGRESS = 2
+
+class TokenBucket:
+    """Token bucket refilled with rate tokens per second up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.time = time.monotonic()
+        self.blocked_until = 0
+
+    def refill(self):
+        """Add the tokens of the time passed since the last refill"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.time) * self.rate)
+        self.time = now
+
+    def get_delay(self):
+        """Get seconds till a token is available"""
+        self.refill()
+        delay = max(0, self.blocked_until - time.monotonic())
+        if self.tokens < 1:
+            delay = max(delay, (1 - self.tokens) / self.rate)
+        return delay
+
+    def take(self):
+        """Take a token"""
+        self.refill()
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """Block the bucket, e.g. when telegram asks to retry after seconds"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class OutboundMessage:
+    """Message waiting in the queue"""
+
+    def __init__(self, chat_id, send, priority, sequence, key):
+        self.chat_id = chat_id
+        self.send = send
+        self.priority = priority
+        self.sequence = sequence
+        self.key = key
+        self.retries = 0
+        self.not_before = 0
+        self.future = asyncio.get_running_loop().create_future()
+
+global_bucket = TokenBucket(GLOBAL_MESSAGE_RATE, GLOBAL_MESSAGE_BURST)
+chat_buckets = {}
+outbound_messages = []
+coalesced_messages = {}
+sending_chats = set()
+send_tasks = set()
+sequence_counter = itertools.count()
+queue_event = None
+dispatcher_task = None
+
+def get_chat_bucket(chat_id):
+    """Get token bucket of chat"""
+    if chat_id not in chat_buckets:
+        chat_buckets[chat_id] = TokenBucket(CHAT_MESSAGE_RATE, CHAT_MESSAGE_BURST)
+    return chat_buckets[chat_id]
+
+def queue_message(chat_id, send, priority=PRIORITY_REPLY, key=None):
+    """Queue coroutine function send for chat, a queued message with the same key is replaced"""
+    global queue_event, dispatcher_task
+    if key is not None and key in coalesced_messages:
+        outbound_message = coalesced_messages[key]
+        outbound_message.send = send
+        return outbound_message.future
+    outbound_message = OutboundMessage(chat_id, send, priority, next(sequence_counter), key)
+    if key is not None:
+        coalesced_messages[key] = outbound_message
+    outbound_messages.append(outbound_message)
+    if queue_event is None:
+        queue_event = asyncio.Event()
+    queue_event.set()
+    if dispatcher_task is None or dispatcher_task.done():
+        dispatcher_task = asyncio.create_task(dispatch_messages())
+    return outbound_message.future
+
+def reply_text(message, text, priority=PRIORITY_REPLY, **kwargs):
+    """Queue reply to message, get future with the sent message"""
+    return queue_message(message.chat_id, partial(message.reply_text, text, **kwargs), priority)
+
+def edit_text(message, text, **kwargs):
+    """Queue progress edit of message, replacing an edit of message still in the queue"""
+    return queue_message(
+        message.chat_id, partial(message.edit_text, text, **kwargs), PRIORITY_PROGRESS,
+        ("edit", message.chat_id, message.message_id))
+
+def get_next_message():
+    """Get the first message by priority that may be sent now, else seconds to wait"""
+    now = time.monotonic()
+    delay = None
+    # Messages of a chat are sent one at a time and in order, also when a message is retried
+    waiting_chats = set(sending_chats)
+    for outbound_message in sorted(
+            outbound_messages, key=lambda item: (item.priority, item.sequence)):
+        if outbound_message.chat_id in waiting_chats:
+            continue
+        message_delay = max(
+            outbound_message.not_before - now,
+            get_chat_bucket(outbound_message.chat_id).get_delay())
+        if message_delay <= 0:
+            return outbound_message, 0
+        waiting_chats.add(outbound_message.chat_id)
+        if delay is None or message_delay < delay:
+            delay = message_delay
+    return None, delay
+
+async def dispatch_messages():
+    """Send queued messages within the global and per chat rate limits"""
+    while True:
+        outbound_message, delay = get_next_message()
+        if outbound_message is None:
+            queue_event.clear()
+            try:
+                await asyncio.wait_for(queue_event.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        global_delay = global_bucket.get_delay()
+        if global_delay > 0:
+            await asyncio.sleep(global_delay)
+            continue
+        global_bucket.take()
+        get_chat_bucket(outbound_message.chat_id).take()
+        outbound_messages.remove(outbound_message)
+        if outbound_message.key is not None:
+            coalesced_messages.pop(outbound_message.key, None)
+        sending_chats.add(outbound_message.chat_id)
+        task = asyncio.create_task(send_message(outbound_message))
+        send_tasks.add(task)
+        task.add_done_callback(send_tasks.discard)
+
+async def send_message(outbound_message):
+    """Send message, requeue it when telegram asks to retry or on a network error"""
+    retry_delay = None
+    result = None
+    status = "sent"
+    chat = str(outbound_message.chat_id)
+    try:
+        with SEND_SECONDS.labels(get_chat_label(chat)).time():
+            result = await outbound_message.send()
+    except RetryAfter as exception:
+        get_chat_bucket(outbound_message.chat_id).block(exception.retry_after)
+        retry_delay = 0
+        status = "retry_after"
+    except NetworkError as exception:
+        if outbound_message.retries < MAX_SEND_RETRIES:
+            retry_delay = SEND_RETRY_DELAY * 2 ** outbound_message.retries
+            outbound_message.retries += 1
+            status = "retry"
+        else:
+            print(f"Message to {outbound_message.chat_id} not sent: {exception}")
+            status = "failed"
+    except TelegramError as exception:
+        print(f"Message to {outbound_message.chat_id} not sent: {exception}")
+        status = "failed"
+    finally:
+        sending_chats.discard(outbound_message.chat_id)
+    MESSAGES.labels(get_chat_label(chat), status).inc()
+    if retry_delay is not None and outbound_message.key in coalesced_messages:
+        # A newer version of the message is queued, drop this version
+        retry_delay = None
+    if retry_delay is not None:
+        outbound_message.not_before = time.monotonic() + retry_delay
+        outbound_messages.append(outbound_message)
+        if outbound_message.key is not None:
+            coalesced_messages[outbound_message.key] = outbound_message
+    elif not outbound_message.future.done():
+        outbound_message.future.set_result(result)
+    queue_event.set()
+
+async def close_message_queue():
+    """Send the pending messages within the close timeout and stop the queue"""
+    global dispatcher_task
+    start_time = time.monotonic()
+    while (len(outbound_messages) > 0 or len(sending_chats) > 0) and \
+        time.monotonic() - start_time < CLOSE_TIMEOUT:
+        await asyncio.sleep(0.1)
+    if dispatcher_task is not None:
+        dispatcher_task.cancel()
+        dispatcher_task = None
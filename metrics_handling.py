@@ -0,0 +1,71 @@
+"""Metrics handling, exposes durations and counts of the scan pipeline stages to Prometheus"""
+import hashlib
+import os
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Serve the metrics on http://METRICS_ADDRESS:METRICS_PORT/metrics, the container listens on all
+# interfaces so the published port can be scraped
+METRICS_ENABLED = True
+METRICS_ADDRESS = os.environ.get("METRICS_ADDRESS", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))
+# Hex digits of the hash of the chat id labelling the metrics of a chat, the chat ids of the
+# users are not exposed
+CHAT_LABEL_LENGTH = 8
+# Buckets in seconds of the scan duration, up to the longest timeframe of an hour
+SCAN_DURATION_BUCKETS = [0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 900, 1800, 3600]
+
+TICKER_FETCH_SECONDS = Histogram(
+    "cryptoscanner_ticker_fetch_seconds", "Duration of fetching the tickers of a market group",
+    ["exchange"])
+OHLCV_FETCH_SECONDS = Histogram(
+    "cryptoscanner_ohlcv_fetch_seconds", "Duration of fetching the candles of a pair",
+    ["exchange", "timeframe"])
+INDICATOR_SECONDS = Histogram(
+    "cryptoscanner_indicator_seconds", "Duration of calculating the indicators of scanned pairs",
+    ["exchange", "timeframe"])
+TRIGGER_SECONDS = Histogram(
+    "cryptoscanner_trigger_seconds", "Duration of evaluating the triggers of the scanned pairs",
+    ["exchange", "timeframe"])
+RENDER_SECONDS = Histogram(
+    "cryptoscanner_render_seconds", "Duration of rendering the signal messages of a timeframe",
+    ["chat", "timeframe"])
+SEND_SECONDS = Histogram(
+    "cryptoscanner_telegram_send_seconds", "Duration of sending a message to telegram", ["chat"])
+MESSAGES = Counter(
+    "cryptoscanner_telegram_messages", "Messages sent to telegram by result", ["chat", "result"])
+EXCHANGE_ERRORS = Counter(
+    "cryptoscanner_exchange_errors", "Failed requests to the exchange by error",
+    ["exchange", "method", "error"])
+SCAN_SECONDS = Histogram(
+    "cryptoscanner_scan_seconds", "Duration of the scan of all pairs of a timeframe",
+    ["exchange", "timeframe"], buckets=SCAN_DURATION_BUCKETS)
+LAST_SCAN_SECONDS = Gauge(
+    "cryptoscanner_last_scan_seconds", "Duration of the last scan of a timeframe",
+    ["exchange", "timeframe"])
+CANDLE_PERIOD_SECONDS = Gauge(
+    "cryptoscanner_candle_period_seconds", "Period of the candles of a timeframe",
+    ["exchange", "timeframe"])
+SCAN_OVERRUNS = Counter(
+    "cryptoscanner_scan_overruns", "Scans that took longer than the candle period",
+    ["exchange", "timeframe"])
+
+def get_chat_label(chat_id):
+    """Get label of the metrics of chat, a short hash of its id"""
+    return hashlib.sha256(str(chat_id).encode()).hexdigest()[:CHAT_LABEL_LENGTH]
+
+def observe_scan(exchange_id, timeframe, seconds, period):
+    """Record duration of the scan of timeframe and count it when longer than the candle period"""
+    SCAN_SECONDS.labels(exchange_id, timeframe).observe(seconds)
+    LAST_SCAN_SECONDS.labels(exchange_id, timeframe).set(seconds)
+    CANDLE_PERIOD_SECONDS.labels(exchange_id, timeframe).set(period)
+    if seconds > period:
+        SCAN_OVERRUNS.labels(exchange_id, timeframe).inc()
+
+def start_metrics_server():
+    """Serve the metrics over HTTP in a background thread"""
+    if not METRICS_ENABLED:
+        return
+    try:
+        start_http_server(METRICS_PORT, METRICS_ADDRESS)
+    except OSError as exception:
+        print(f"Metrics not served on port {METRICS_PORT}: {exception}")
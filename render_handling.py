@@ -0,0 +1,181 @@
+"""Render handling, renders the message of a signal once per scan for all chats with the same
+settings"""
+import math
+
+tool_url = {
+    "tradingview": "https://www.tradingview.com/chart?symbol=",
+    "hypertrader": "https://gethypertrader.com/app",
+    "kucoin": "https://www.kucoin.com/trade/",
+    "altrady": "https://app.altrady.com/d/",
+}
+
+altrady_exchange = {
+    "binance": "bina",
+    "bybit": "bybi",
+    "kucoin": "kucn"
+}
+
+def get_tool_url(tool, exchange, pair, timeframe_minute):
+    """Get tool url"""
+    if tool == "tradingview":
+        return tool_url[tool] + exchange.upper() + "%3A" + pair.replace('/', '') + \
+               f"&interval={timeframe_minute}"
+    elif tool == "hypertrader":
+        return tool_url[tool]
+    elif tool == "kucoin":
+        return tool_url[tool] + pair.replace('/', '-')
+    elif tool == "altrady":
+        pair_swapped = pair.split('/')
+        pair_swapped.reverse()
+        altrady_exchange_str = altrady_exchange[exchange]
+        if ":" in pair_swapped[0]:
+            altrady_exchange_str += "f"
+            pair_swapped[0] = pair_swapped[0].split(":")[0]
+        return tool_url[tool] + altrady_exchange_str + "_" + '_'.join(pair_swapped)
+    else:
+        return ""
+
+emoji_type = {
+    "Buy": "\U0001F7E2",  # Green circle
+    "Sell": "\U0001F534", # Red   circle
+    "None": "\U0001F7E2"  # Green circle
+}
+
+emoji_momentum_level = {
+    range(0, 20):   "\U0001F7E9",  # Green square
+    range(20, 25):  "\U0001F7EA",  # Purple square
+    range(25, 30):  "\U0001F7E6",  # Blue square
+    range(30, 70):  "\U0001F533",  # White square
+    range(70, 75):  "\U0001F7E8",  # Yellow square
+    range(75, 80):  "\U0001F7E7",  # Orange square
+    range(80, 101): "\U0001F7E5",  # Red square
+}
+
+# Emoji of each momentum strength from 0 till 100, looked up by index
+momentum_emojis = [
+    next((emoji for level, emoji in emoji_momentum_level.items() if strength in level), "")
+    for strength in range(101)]
+
+# Characters escaped in MarkdownV2 text
+MARKDOWN_ESCAPE_TABLE = str.maketrans({
+    ".": r"\.", "|": r"\|", "-": r"\-", "{": r"\{", "}": r"\}"})
+
+def escape_markdown(text):
+    """Escape MarkdownV2 characters of text"""
+    return text.translate(MARKDOWN_ESCAPE_TABLE)
+
+def get_momentum_emoji(momentum_strength):
+    """Get emoji of momentum strength, empty when out of range"""
+    if 0 <= momentum_strength < len(momentum_emojis):
+        return momentum_emojis[momentum_strength]
+    return ""
+
+def get_message_content(item, timeframe_minute, base_coin, tool, exchange):
+    """Get content of message of signal, rendered once per scan for the same settings"""
+    rendered = item.table.rendered
+    key = (item.index, timeframe_minute, base_coin, tool, exchange)
+    if key not in rendered:
+        rendered[key] = render_message_content(item, timeframe_minute, base_coin, tool, exchange)
+    return rendered[key]
+
+def render_message_content(item, timeframe_minute, base_coin, tool, exchange):
+    """Compose content of message"""
+    message_content = ""
+    previour_date_time = ""
+    date_time = item["datetime"]
+    pair = item["pair"]
+    pair_url = f"[{pair}]({get_tool_url(tool, exchange, pair, timeframe_minute)})"
+    close = item["close"]
+    quote_volume_m = item["quote_volume_m"]
+    change_day = item["change_day"]
+    change_day_perc = item["change_day_perc"]
+    signal_list = {}
+    signal = {}
+
+    bb_buy = item["bbBuy"]
+    stoch_buy = item["stochBuy"]
+    stoch_rsi_buy = item["stochRsiBuy"]
+    rsi_buy = item["rsiBuy"]
+
+    bb_sell = item["bbSell"]
+    stoch_sell = item["stochSell"]
+    stoch_rsi_sell = item["stochRsiSell"]
+    rsi_sell = item["rsiSell"]
+
+    bb_signal = bb_buy or bb_sell
+    stoch_signal = stoch_buy or stoch_sell
+    stoch_rsi_signal = stoch_rsi_buy or stoch_rsi_sell
+    rsi_signal = rsi_buy or rsi_sell
+    rsi_max = 70
+    rsi_min = 30
+    rsi = item["rsi"]
+
+    signal_list["Buy"] = [
+        "BB" if bb_buy else '',
+        "Stoch" if stoch_buy else '',
+        "StochRsi" if stoch_rsi_buy else '',
+        "RSIpre" if rsi_buy and rsi > rsi_min else "RSI" if rsi_buy else ''
+    ]
+    signal_list["Sell"] = [
+        "BB" if bb_sell else '',
+        "Stoch" if stoch_sell else '',
+        "StochRsi" if stoch_rsi_sell else '',
+        "RSIpre" if rsi_sell and rsi < rsi_max else "RSI" if rsi_sell else ''
+    ]
+    signal_list["Buy"] = [x for x in signal_list["Buy"] if x != '']
+    signal_list["Sell"] = [x for x in signal_list["Sell"] if x != '']
+
+    signal["Buy"] = ', '.join(signal_list["Buy"])
+    signal["Sell"] = ', '.join(signal_list["Sell"])
+    signal_type = "Buy" if len(signal["Buy"]) > 0 \
+        else "Sell" if len(signal["Sell"]) > 0 else "None"
+    signal_emoji = emoji_type[signal_type]
+    high = item["high"]
+    low = item["low"]
+    bb_width = item["bbWidth"]
+    stoch_k = item["stochK"]
+    stoch_d = item["stochD"]
+    stoch_rsi_d = item["stochRsiD"]
+    stoch_rsi_k = item["stochRsiK"]
+    # Calculate momentum strength by using combination of stoch and rsi
+    momentum_strength = round(rsi)
+
+    macd_value = item["macdValue"]
+    macd_signal = item.get("macdSignal", 0)
+    macd_diff = item.get("macdDiff", 0)
+    ema200 = item.get("ema200", 0)
+    momentum_emoji = get_momentum_emoji(momentum_strength)
+    if previour_date_time != date_time:
+        previour_date_time = date_time
+        message_content += f"{signal_emoji} *{date_time.strftime('%Y %m %d %H%M')} " + \
+            f"| {timeframe_minute} min*\n"
+    # Down arrow if close < ema200, else up arrow
+    ema200_diff = ((close - ema200) / close) * 100
+    ema200_arrow = "\U00002B07" if ema200_diff < 0 else "\U00002B06" if ema200_diff > 0 else "\U00002B0D"
+    # The EMA200 is shown once the candle buffer holds enough candles
+    ema200_line = "" if math.isnan(ema200) else \
+        f"EMA200: {ema200:.5f} {ema200_arrow} {ema200_diff:.3f}%\n"
+    stoch_rsi_diff = stoch_rsi_k - stoch_rsi_d
+    stoch_rsi_arrow = "\U00002B07" if stoch_rsi_diff < 0 else "\U00002B06" if stoch_rsi_diff > 0 else "\U00002B0D"
+    stoch_diff = stoch_k - stoch_d
+    stoch_arrow = "\U00002B07" if stoch_diff < 0 else "\U00002B06" if stoch_diff > 0 else "\U00002B0D"
+    message_content += \
+        f"{momentum_emoji} {momentum_strength}% *{pair_url} | [{signal[signal_type]}]*\n" \
+        f"Change day: {change_day:.2f} | {change_day_perc:.2f}% | " + \
+        f"{quote_volume_m:7.2f}M {base_coin}\n" + \
+        f"{'*' if bb_signal else ''}" \
+        f"BB H|L|W: {high:.5f} | {low:.5f} | {bb_width:.2f}%" \
+        f"{'*' if bb_signal else ''}\n" \
+        f"{'*' if stoch_signal else ''}" \
+        f"Stoch D: {stoch_d:.2f}% K: {stoch_k:.2f}% {stoch_arrow} {stoch_diff:.1f}%\n" \
+        f"{'*' if stoch_signal else ''}" \
+        f"{'*' if stoch_rsi_signal else ''}" \
+        f"StochRsi D: {stoch_rsi_d:.2f}% K: {stoch_rsi_k:.2f}% {stoch_rsi_arrow} {stoch_rsi_diff:.1f}%" \
+        f"{'*' if stoch_rsi_signal else ''}\n" \
+        f"{'*' if rsi_signal else ''}" \
+        f"RSI: {rsi:.2f}%" \
+        f"{'*' if rsi_signal else ''}\n" \
+        f"MACD: {macd_value:.3f} Signal: {macd_signal:.3f} Histogram: {macd_diff:.3f}\n" \
+        f"{ema200_line}" \
+        f"Close: {close:.5f}\n\n"
+    return escape_markdown(message_content)
@@ -0,0 +1,187 @@
+"""Scheduler handling, scans the union of the subscriptions of all chats once per candle"""
+import asyncio
+import time
+from itertools import zip_longest
+
+from exchange_handling import (get_exchange, sync_clock, get_exchange_milliseconds, scan_pairs,
+                               get_timeframe, get_source_timeframe)
+from signal_handling import filter_signals
+from indicator_handling import get_history_depth
+from stream_handling import update_streams
+from transport_handling import get_clock_speed
+from metrics_handling import observe_scan
+
+# Number of pairs scanned at once, pairs are taken round robin from the chats
+SCAN_CHUNK_SIZE = 25
+# Seconds to wait after a candle closes before scanning, so the exchange has settled the candle
+SETTLE_DELAY = 2
+# Seconds before a failed scan of a candle is retried
+SCAN_RETRY_DELAY = 10
+
+subscribed_chats = {}
+scanned_candles = {}
+# Monotonic time from which a failed scan of an exchange and timeframe is retried
+scan_retry_times = {}
+# Candle close and chats already sent the signals of the candle per exchange and timeframe, a
+# retried scan skips them
+served_chats = {}
+
+def subscribe(chat_id, message):
+    """Subscribe chat to the scan, signals are replied to message"""
+    subscribed_chats[chat_id] = {"message": message, "paused": False}
+
+def unsubscribe(chat_id):
+    """Unsubscribe chat from the scan"""
+    subscribed_chats.pop(chat_id, None)
+
+def is_subscribed(chat_id):
+    """Check if chat is subscribed to the scan"""
+    return chat_id in subscribed_chats
+
+def pause(chat_id):
+    """Pause scanning for chat"""
+    if chat_id in subscribed_chats:
+        subscribed_chats[chat_id]["paused"] = True
+
+def resume(chat_id):
+    """Resume scanning for chat"""
+    if chat_id in subscribed_chats:
+        subscribed_chats[chat_id]["paused"] = False
+
+def get_active_chats():
+    """Get messages of subscribed chats that are not paused"""
+    return {chat_id: subscription["message"] for chat_id, subscription in subscribed_chats.items()
+            if not subscription["paused"]}
+
+def get_scan_groups(subscriptions):
+    """Group chats by the exchange and timeframe they subscribe to"""
+    scan_groups = {}
+    for chat_id, subscription in subscriptions.items():
+        for timeframe_minute in subscription["timeframes"]:
+            key = (subscription["exchange"], int(timeframe_minute))
+            scan_groups.setdefault(key, []).append(chat_id)
+    return scan_groups
+
+def get_candle_close(exchange_name, timeframe_minute):
+    """Get timestamp of the last candle close of timeframe on the exchange clock"""
+    timeframe_ms = int(timeframe_minute) * 60000
+    exchange_id = get_exchange(exchange_name).id
+    return get_exchange_milliseconds(exchange_id) // timeframe_ms * timeframe_ms
+
+def get_next_scan_delay(subscriptions):
+    """Get seconds till the next candle close of the subscriptions plus the settle delay"""
+    next_scan_delay = None
+    for exchange_name, timeframe_minute in get_scan_groups(subscriptions):
+        if scanned_candles.get((exchange_name, timeframe_minute)) != \
+            get_candle_close(exchange_name, timeframe_minute):
+            retry_time = scan_retry_times.get((exchange_name, timeframe_minute), 0)
+            return max(0, retry_time - time.monotonic())
+        next_candle_close = get_candle_close(exchange_name, timeframe_minute) + \
+            timeframe_minute * 60000
+        delay = (next_candle_close - get_exchange_milliseconds(get_exchange(exchange_name).id)) / \
+            1000 + SETTLE_DELAY
+        # The clock runs faster than the real time when replaying a recording
+        delay /= get_clock_speed()
+        if next_scan_delay is None or delay < next_scan_delay:
+            next_scan_delay = delay
+    return next_scan_delay
+
+def get_fair_pair_order(subscriptions, chat_ids):
+    """Order pairs round robin over the chats, so a long pair list cannot starve other chats"""
+    pair_lists = [subscriptions[chat_id]["pairs"] for chat_id in chat_ids]
+    pairs = {}
+    for round_pairs in zip_longest(*pair_lists):
+        for pair in round_pairs:
+            if pair is not None:
+                pairs[pair] = None
+    return list(pairs)
+
+async def scan_group(exchange_name, timeframe_minute, chat_ids, subscriptions, send_signals):
+    """Scan pairs of all chats in group once and send each chat the signals of its pairs"""
+    candle_close = get_candle_close(exchange_name, timeframe_minute)
+    if scanned_candles.get((exchange_name, timeframe_minute)) == candle_close or \
+        scan_retry_times.get((exchange_name, timeframe_minute), 0) > time.monotonic():
+        return
+    # The candle is scanned again after the retry delay when the scan fails
+    scan_retry_times[(exchange_name, timeframe_minute)] = time.monotonic() + SCAN_RETRY_DELAY
+    start_time = time.perf_counter()
+    served_candle_close, served_chat_ids = served_chats.get(
+        (exchange_name, timeframe_minute), (None, set()))
+    if served_candle_close != candle_close:
+        served_chat_ids = set()
+        served_chats[(exchange_name, timeframe_minute)] = (candle_close, served_chat_ids)
+    # Only the chats not sent their signals by a failed scan of the candle are scanned
+    pending_chat_ids = [chat_id for chat_id in chat_ids if chat_id not in served_chat_ids]
+    pairs = get_fair_pair_order(subscriptions, pending_chat_ids)
+    data = {}
+    scanned_pairs = set()
+    indicator_trigger_lists = [
+        subscriptions[chat_id]["indicator_trigger"] for chat_id in pending_chat_ids]
+    chunks = [pairs[index:index + SCAN_CHUNK_SIZE]
+              for index in range(0, max(len(pairs), 1), SCAN_CHUNK_SIZE)]
+    # The chunks are scanned concurrently, so the indicators of a chunk are calculated on the
+    # worker processes while the candles of the next chunks are fetched, and sent in order
+    tasks = [asyncio.create_task(
+        scan_pairs(exchange_name, timeframe_minute, chunk, indicator_trigger_lists))
+        for chunk in chunks]
+    try:
+        for chunk, task in zip(chunks, tasks):
+            data.update(await task)
+            scanned_pairs.update(chunk)
+            for chat_id in list(pending_chat_ids):
+                chat_pairs = subscriptions[chat_id]["pairs"]
+                if scanned_pairs.issuperset(chat_pairs):
+                    pending_chat_ids.remove(chat_id)
+                    chat_data = {pair: data[pair] for pair in chat_pairs if pair in data}
+                    await send_signals(
+                        chat_id, timeframe_minute,
+                        filter_signals(chat_data, subscriptions[chat_id]["indicator_trigger"]))
+                    served_chat_ids.add(chat_id)
+    finally:
+        for task in tasks:
+            task.cancel()
+    scanned_candles[(exchange_name, timeframe_minute)] = candle_close
+    scan_retry_times.pop((exchange_name, timeframe_minute), None)
+    served_chats.pop((exchange_name, timeframe_minute), None)
+    # The scan of a timeframe should finish before its next candle closes
+    observe_scan(get_exchange(exchange_name).id, get_timeframe(timeframe_minute),
+                 (time.perf_counter() - start_time) * get_clock_speed(), timeframe_minute * 60)
+
+def get_candle_depths(subscriptions):
+    """Get number of closed candles the scans need of each (exchange_name, pair, timeframe)
+    candle series of the subscriptions, None for the whole candle buffer"""
+    candle_depths = {}
+    for subscription in subscriptions.values():
+        exchange_name = subscription["exchange"]
+        exchange = get_exchange(exchange_name)
+        depth = get_history_depth([subscription["indicator_trigger"]])
+        for timeframe_minute in subscription["timeframes"]:
+            timeframe = get_timeframe(timeframe_minute)
+            source_timeframe = get_source_timeframe(exchange_name, timeframe)
+            timeframe_depth = depth
+            if source_timeframe != timeframe:
+                # The scan resamples the source candles of the last closed and the current candle
+                timeframe_depth = 2 * exchange.parse_timeframe(timeframe) // \
+                    exchange.parse_timeframe(source_timeframe)
+            for pair in subscription["pairs"]:
+                key = (exchange_name, pair, source_timeframe)
+                previous_depth = candle_depths.get(key, 0)
+                candle_depths[key] = None if previous_depth is None or timeframe_depth is None \
+                    else max(previous_depth, timeframe_depth)
+    return candle_depths
+
+async def scan_subscriptions(subscriptions, send_signals):
+    """Scan the union of the subscriptions of all chats with a closed candle not scanned yet"""
+    scan_groups = get_scan_groups(subscriptions)
+    update_streams(get_candle_depths(subscriptions))
+    await asyncio.gather(*[
+        sync_clock(exchange_name)
+        for exchange_name in dict.fromkeys(exchange_name for exchange_name, _ in scan_groups)])
+    results = await asyncio.gather(*[
+        scan_group(exchange_name, timeframe_minute, chat_ids, subscriptions, send_signals)
+        for (exchange_name, timeframe_minute), chat_ids in scan_groups.items()],
+        return_exceptions=True)
+    # A failed group does not stop the scans of the other groups, it is retried
+    for (exchange_name, timeframe_minute), result in zip(scan_groups, results):
+        if isinstance(result, Exception):
+            print(f"Scan of {exchange_name} {timeframe_minute} min failed: {result}")
@@ -0,0 +1,114 @@
+"""Signal handling, keeps the indicators and triggers of a scan in one array with a row per pair"""
+from datetime import datetime
+import numpy as np
+import pytz
+
+from indicator_handling import get_signal_triggers
+
+# Time zone of the date time of the signals
+SIGNAL_TIMEZONE = pytz.timezone('Europe/Amsterdam')
+# Indicators of the last candle stored per pair
+SIGNAL_INDICATORS = [
+    "close", "bb_bbm", "bb_bbh", "bb_bbl", "stoch", "stoch_signal", "rsi", "stochrsi_k",
+    "stochrsi_d", "macd", "macd_signal", "macd_diff", "ema200"]
+SIGNAL_TRIGGERS = [
+    "bbBuy", "stochBuy", "stochRsiBuy", "rsiBuy", "bbSell", "stochSell", "stochRsiSell",
+    "rsiSell"]
+SIGNAL_DTYPE = np.dtype(
+    [("timestamp", np.int64), ("open_day", np.float64), ("quote_volume", np.float64)] +
+    [(name, np.float64) for name in SIGNAL_INDICATORS] +
+    [(name, np.bool_) for name in SIGNAL_TRIGGERS])
+
+# Fields of a signal calculated from its row when read
+SIGNAL_FIELDS = {
+    "datetime": lambda row: datetime.fromtimestamp(row["timestamp"] / 1000, SIGNAL_TIMEZONE),
+    "close": lambda row: row["close"],
+    "quote_volume_m": lambda row: row["quote_volume"] / 1000000,
+    "change_day": lambda row: row["close"] - row["open_day"],
+    "change_day_perc": lambda row: (row["close"] - row["open_day"]) / row["open_day"] * 100,
+    # Bollinger Bands features
+    "high": lambda row: row["bb_bbh"],
+    "low": lambda row: row["bb_bbl"],
+    "bbWidth": lambda row: (row["bb_bbh"] - row["bb_bbl"]) / row["bb_bbm"] * 100,
+    "stochD": lambda row: row["stoch_signal"],
+    "stochK": lambda row: row["stoch"],
+    "stochRsiD": lambda row: row["stochrsi_d"] * 100,
+    "stochRsiK": lambda row: row["stochrsi_k"] * 100,
+    "rsi": lambda row: row["rsi"],
+    "macdValue": lambda row: row["macd"],
+    "macdSignal": lambda row: row["macd_signal"],
+    "macdDiff": lambda row: row["macd_diff"],
+    "ema200": lambda row: row["ema200"],
+    **{name: (lambda row, name=name: row[name]) for name in SIGNAL_TRIGGERS}
+}
+
+class SignalTable:
+    """Indicators and triggers of the last candle of the pairs of a scan"""
+
+    def __init__(self, pairs, timestamps, open_days, quote_volumes, indicators):
+        self.pairs = pairs
+        # Rendered messages of the signals by row and message settings, shared by the chats
+        self.rendered = {}
+        indicators = {name: np.asarray(values, dtype=np.float64)
+                      for name, values in indicators.items()}
+        self.rows = np.empty(len(pairs), dtype=SIGNAL_DTYPE)
+        self.rows["timestamp"] = timestamps
+        self.rows["open_day"] = open_days
+        self.rows["quote_volume"] = quote_volumes
+        for name in SIGNAL_INDICATORS:
+            self.rows[name] = indicators[name]
+        with np.errstate(invalid="ignore"):
+            for name, triggered in get_signal_triggers(indicators).items():
+                self.rows[name] = triggered
+
+    def get_records(self):
+        """Get signal record of each pair by pair"""
+        return {pair: SignalRecord(self, index) for index, pair in enumerate(self.pairs)}
+
+    def get_triggered(self, indicator_trigger_list, signal_type):
+        """Get rows triggered by all indicators of trigger list"""
+        triggered = np.ones(len(self.rows), dtype=bool)
+        for indicator in indicator_trigger_list:
+            triggered &= self.rows[f"{indicator}{signal_type}"]
+        return triggered
+
+class SignalRecord:
+    """Signal of one pair, a view on its row of the signal table"""
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == "pair":
+            return self.table.pairs[self.index]
+        value = SIGNAL_FIELDS[key](self.table.rows[self.index])
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __contains__(self, key):
+        return key == "pair" or key in SIGNAL_FIELDS
+
+    def get(self, key, default=None):
+        """Get field of signal, default when the signal has no such field"""
+        return self[key] if key in self else default
+
+def filter_signals(data, indicator_trigger_list):
+    """Filter buy and sell signals triggered by all indicators of trigger list, in data order"""
+    table_rows = {}
+    for position, record in enumerate(data.values()):
+        positions, indices = table_rows.setdefault(record.table, ([], []))
+        positions.append(position)
+        indices.append(record.index)
+    signal_list = {}
+    for signal_type in ["Buy", "Sell"]:
+        selected_positions = []
+        selected_records = []
+        for table, (positions, indices) in table_rows.items():
+            triggered = table.get_triggered(indicator_trigger_list, signal_type)[indices]
+            selected_positions.extend(np.asarray(positions)[triggered].tolist())
+            selected_records.extend(
+                SignalRecord(table, index) for index in np.asarray(indices)[triggered].tolist())
+        order = np.argsort(selected_positions, kind="stable")
+        signal_list[signal_type] = [selected_records[index] for index in order]
+    return signal_list
@@ -0,0 +1,126 @@
+"""State handling, keeps the chat settings in memory and writes changes behind to disk"""
+import asyncio
+import json
+
+from file_handling import (
+    load_json, save_text,
+    FILENAMEBUYSIGNALSACTIVE, FILENAMEEXCHANGE, FILENAMEMINQUOTEVOLUME, FILENAMETIMEFRAMELIST,
+    FILENAMEBASECOIN, FILENAMEPAIRLIST, FILENAMEINDICATORTRIGGER, FILENAMETOOL)
+
+STATE_FILES = [
+    FILENAMEBUYSIGNALSACTIVE,
+    FILENAMEEXCHANGE,
+    FILENAMEMINQUOTEVOLUME,
+    FILENAMETIMEFRAMELIST,
+    FILENAMEBASECOIN,
+    FILENAMEPAIRLIST,
+    FILENAMEINDICATORTRIGGER,
+    FILENAMETOOL
+]
+# Seconds changes are collected before the changed files are written to disk
+STATE_FLUSH_DELAY = 1
+
+states = {}
+dirty_files = set()
+flush_task = None
+flush_lock = None
+
+async def load_state():
+    """Load all state files into memory once"""
+    for file_name in STATE_FILES:
+        if file_name not in states:
+            states[file_name] = await asyncio.to_thread(load_json, file_name)
+
+def get_state(file_name):
+    """Get in memory state of file, loaded from disk when not loaded at startup"""
+    if file_name not in states:
+        states[file_name] = load_json(file_name)
+    return states[file_name]
+
+def get_chat_value(file_name, chat_id, default=None):
+    """Get state value of chat_id"""
+    return get_state(file_name).get(chat_id, default)
+
+def set_chat_value(file_name, chat_id, value):
+    """Set state value of chat_id and write it behind to disk"""
+    get_state(file_name)[chat_id] = value
+    mark_dirty(file_name)
+
+def add_chat_value(file_name, chat_id, value):
+    """Add to the list state value of chat_id and write it behind to disk"""
+    get_state(file_name).setdefault(chat_id, []).extend(value)
+    mark_dirty(file_name)
+
+def mark_dirty(file_name):
+    """Mark file changed and schedule writing it to disk"""
+    global flush_task
+    dirty_files.add(file_name)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop, write the file right away
+        flush_file(file_name)
+        return
+    if flush_task is None or flush_task.done():
+        flush_task = loop.create_task(flush_state_delayed())
+
+def flush_file(file_name):
+    """Write state of file to disk"""
+    dirty_files.discard(file_name)
+    save_text(file_name, json.dumps(states[file_name]))
+
+async def flush_state_delayed():
+    """Write changed files to disk after the flush delay"""
+    await asyncio.sleep(STATE_FLUSH_DELAY)
+    await flush_state()
+
+async def flush_state():
+    """Write changed files to disk without blocking the event loop"""
+    global flush_lock
+    if flush_lock is None:
+        flush_lock = asyncio.Lock()
+    async with flush_lock:
+        while len(dirty_files) > 0:
+            file_name = dirty_files.pop()
+            # Serialize in the event loop so the snapshot is consistent
+            text = json.dumps(states[file_name])
+            try:
+                await asyncio.to_thread(save_text, file_name, text)
+            except OSError as exception:
+                print(f"Error writing state file {file_name}: {exception}")
+                dirty_files.add(file_name)
+                break
+
+# Typed per chat accessors
+def get_chat_tool(chat_id):
+    """Get tool of chat, None when not selected"""
+    return get_chat_value(FILENAMETOOL, chat_id)
+
+def get_chat_exchange(chat_id, default=None):
+    """Get exchange name of chat"""
+    return get_chat_value(FILENAMEEXCHANGE, chat_id, default)
+
+def get_chat_base_coin(chat_id):
+    """Get base coin of chat, None when not selected"""
+    return get_chat_value(FILENAMEBASECOIN, chat_id)
+
+def get_chat_min_quote_volume(chat_id):
+    """Get minimum quote volume of chat as int, None when not selected"""
+    min_quote_volume = get_chat_value(FILENAMEMINQUOTEVOLUME, chat_id)
+    return None if min_quote_volume is None else int(min_quote_volume)
+
+def get_chat_timeframes(chat_id):
+    """Get list of timeframe minutes of chat, None when not selected"""
+    return get_chat_value(FILENAMETIMEFRAMELIST, chat_id)
+
+def get_chat_pairs(chat_id):
+    """Get pair list of chat, None when not generated"""
+    return get_chat_value(FILENAMEPAIRLIST, chat_id)
+
+def get_chat_indicator_trigger(chat_id):
+    """Get list of trigger indicators of chat, None when not selected"""
+    return get_chat_value(FILENAMEINDICATORTRIGGER, chat_id)
+
+def get_chat_signals_active(chat_id):
+    """Check if signals are active for chat"""
+    return bool(get_chat_value(FILENAMEBUYSIGNALSACTIVE, chat_id, False))
@@ -0,0 +1,75 @@
+"""Stream handling, keeps candle buffers up to date from the candle channels over WebSocket"""
+import asyncio
+import ccxt
+
+from candle_handling import get_candle_buffer, get_candle_lock
+from exchange_handling import get_exchange, fetch_candles
+
+# Seconds before resubscribing a failed stream, doubled per failure up to the maximum
+STREAM_RECONNECT_DELAY = 1
+STREAM_MAX_RECONNECT_DELAY = 60
+
+stream_tasks = {}
+# Number of closed candles a stream fills its buffer with, None for the whole candle buffer
+stream_depths = {}
+
+def is_streaming_supported(exchange_name):
+    """Check if the client of exchange can watch candles"""
+    return bool(get_exchange(exchange_name).has.get("watchOHLCV"))
+
+async def store_candles(exchange_id, pair, timeframe, timeframe_ms, bars):
+    """Store streamed candles, False when candles are missing between buffer and stream"""
+    candle_buffer = get_candle_buffer(exchange_id, pair, timeframe)
+    async with get_candle_lock(exchange_id, pair, timeframe):
+        last_timestamp = candle_buffer.last_timestamp()
+        if last_timestamp is None or bars[0][0] > last_timestamp + timeframe_ms:
+            return False
+        candle_buffer.append(bars)
+    return True
+
+async def watch_candles(exchange_name, pair, timeframe):
+    """Watch candles of pair, resubscribe with backoff and backfill missed candles over REST"""
+    exchange = get_exchange(exchange_name)
+    timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+    key = (exchange_name, pair, timeframe)
+    delay = STREAM_RECONNECT_DELAY
+    while True:
+        try:
+            # Backfill the candles missed while not subscribed
+            await fetch_candles(exchange_name, pair, timeframe, stream_depths.get(key))
+            while True:
+                bars = await exchange.watch_ohlcv(pair, timeframe)
+                delay = STREAM_RECONNECT_DELAY
+                if len(bars) > 0 and \
+                    not await store_candles(exchange.id, pair, timeframe, timeframe_ms, bars):
+                    await fetch_candles(exchange_name, pair, timeframe, stream_depths.get(key))
+        except ccxt.NotSupported:
+            print(f"Streaming candles of {pair} not supported by {exchange.id}")
+            return
+        except (ccxt.NetworkError, ccxt.ExchangeError) as exception:
+            print(f"Stream of {pair} {timeframe} failed: {exception}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, STREAM_MAX_RECONNECT_DELAY)
+
+def update_streams(candle_depths):
+    """Watch candles of (exchange_name, pair, timeframe) keys filled with their number of closed
+    candles and stop the other streams"""
+    candle_depths = {key: depth for key, depth in candle_depths.items()
+                     if is_streaming_supported(key[0])}
+    for key in list(stream_tasks):
+        if key not in candle_depths:
+            stream_tasks.pop(key).cancel()
+            stream_depths.pop(key, None)
+    stream_depths.update(candle_depths)
+    for key in candle_depths:
+        if key not in stream_tasks or stream_tasks[key].done():
+            stream_tasks[key] = asyncio.create_task(watch_candles(*key))
+
+async def close_streams():
+    """Stop all streams"""
+    tasks = list(stream_tasks.values())
+    stream_tasks.clear()
+    stream_depths.clear()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,7 +1,6 @@
 """ Telegram handling module """
-import time
-from datetime import datetime
-import pytz
+import asyncio
+import ccxt
 import numpy as np
 
 from dotenv import dotenv_values
@@ -10,11 +9,24 @@ from telegram.constants import ParseMode
 from telegram.ext import (Application, CallbackContext, CommandHandler,
                           PollAnswerHandler)
 from file_handling import (
-    file_exists, add_json, load_json, update_json, save_json,
+    file_exists,
     FILENAMEEXCHANGE, FILENAMEMINQUOTEVOLUME, FILENAMETIMEFRAMELIST, FILENAMEBASECOIN,
     FILENAMEPAIRLIST, FILENAMEBUYSIGNALSACTIVE, FILENAMEINDICATORTRIGGER, FILENAMETOOL)
-from exchange_handling import (set_exchange, fetch_ticker, get_pair_list, retrieve_signals,
-                               prev_timefram_minute_list, set_previous_timeframe_minute_list)
+from state_handling import (
+    load_state, flush_state, get_state, set_chat_value, add_chat_value,
+    get_chat_tool, get_chat_exchange, get_chat_base_coin, get_chat_min_quote_volume,
+    get_chat_timeframes, get_chat_pairs, get_chat_indicator_trigger, get_chat_signals_active)
+from exchange_handling import (get_exchange, load_markets, close_exchanges, fetch_tickers,
+                               get_pair_list, get_timeframe)
+from budget_handling import get_remaining_budget, get_budget, PRIORITY_DISCOVERY
+from message_handling import reply_text, edit_text, close_message_queue, PRIORITY_SIGNAL
+from stream_handling import update_streams, close_streams
+from indicator_handling import close_indicator_pool
+from history_handling import close_history
+from metrics_handling import start_metrics_server, get_chat_label, RENDER_SECONDS
+from render_handling import get_message_content, tool_url, emoji_type
+from scheduler_handling import (subscribe, unsubscribe, is_subscribed, pause, resume,
+                                get_active_chats, get_next_scan_delay, scan_subscriptions)
 
 FILENAMESECRETS = "./secrets/.env"
 
@@ -37,63 +49,24 @@ CMDUPDATEPAIRLIST = "UpdatePairList"
 
 CMDPOLLINDICATORTRIGGER = "PollIndicatorTrigger"
 
-updating_pair_list = {}
-
-tool_url = {
-    "tradingview": "https://www.tradingview.com/chart?symbol=",
-    "hypertrader": "https://gethypertrader.com/app",
-    "kucoin": "https://www.kucoin.com/trade/",
-    "altrady": "https://app.altrady.com/d/",
-}
-
-altrady_exchange = {
-    "binance": "bina",
-    "bybit": "bybi",
-    "kucoin": "kucn"
-}
-
-def get_tool_url(tool, exchange, pair, timeframe_minute):
-    """Get tool url"""
-    if tool == "tradingview":
-        return tool_url[tool] + exchange.upper() + "%3A" + pair.replace('/', '') + \
-               f"&interval={timeframe_minute}"
-    elif tool == "hypertrader":
-        return tool_url[tool]
-    elif tool == "kucoin":
-        return tool_url[tool] + pair.replace('/', '-')
-    elif tool == "altrady":
-        pair_swapped = pair.split('/')
-        pair_swapped.reverse()
-        altrady_exchange_str = altrady_exchange[exchange]
-        if ":" in pair_swapped[0]:
-            altrady_exchange_str += "f"
-            pair_swapped[0] = pair_swapped[0].split(":")[0]
-        return tool_url[tool] + altrady_exchange_str + "_" + '_'.join(pair_swapped)
-    else:
-        return ""
+SCAN_JOB_NAME = "scan_signals"
 
-emoji_type = {
-    "Buy": "\U0001F7E2",  # Green circle
-    "Sell": "\U0001F534", # Red   circle
-    "None": "\U0001F7E2"  # Green circle
-}
+# Maximum number of characters of a telegram message
+MAX_MESSAGE_LENGTH = 4096
+# Pack the signals of a timeframe and signal type into as few messages as possible,
+# instead of sending one message per signal
+PACK_SIGNALS = True
 
-emoji_momentum_level = {
-    range(0, 20):   "\U0001F7E9",  # Green square
-    range(20, 25):  "\U0001F7EA",  # Purple square
-    range(25, 30):  "\U0001F7E6",  # Blue square
-    range(30, 70):  "\U0001F533",  # White square
-    range(70, 75):  "\U0001F7E8",  # Yellow square
-    range(75, 80):  "\U0001F7E7",  # Orange square
-    range(80, 101): "\U0001F7E5",  # Red square
-}
+updating_pair_list = {}
+scan_running = False
 
 def start_telegram_bot():
     """Start telegram bot"""
     if file_exists(FILENAMESECRETS):
         secrets = dotenv_values(FILENAMESECRETS)
         token = secrets["TELEGRAM_TOKEN_SCANNER"]
-        application = Application.builder().token(token).build()
+        application = Application.builder().token(token) \
+            .post_init(startup).post_shutdown(shutdown).build()
         for command, handler in command_dict.items():
             application.add_handler(CommandHandler(command, handler))
         application.add_handler(PollAnswerHandler(receive_poll_selection))
@@ -101,12 +74,28 @@ def start_telegram_bot():
     else:
         print(f"Missing secret file: {FILENAMESECRETS} with telegram token")
 
-# Support methods
-def get_job(job_queue, name):
-    """Get job by name"""
-    queuelist = job_queue.get_jobs_by_name(name=name)
-    return queuelist[0].job if len(queuelist) > 0 else None
+async def startup(application: Application):
+    """Load state and markets of the exchanges in use, from the disk cache when available"""
+    await load_state()
+    start_metrics_server()
+    for exchange_name in set(get_state(FILENAMEEXCHANGE).values()):
+        try:
+            await load_markets(exchange_name)
+        except ccxt.BaseError as exception:
+            # The bot starts without the markets, they are downloaded again in the background
+            print(f"Error loading markets of {exchange_name}: " +
+                  f"{type(exception).__name__} {exception}")
+
+async def shutdown(application: Application):
+    """Write pending state changes and close streams and exchange connections on shutdown"""
+    await flush_state()
+    await close_streams()
+    await close_history()
+    await close_message_queue()
+    await close_exchanges()
+    close_indicator_pool()
 
+# Support methods
 def split_with_numpy(array_list, chunk_size):
     """Split array with numpy"""
     indices = np.arange(chunk_size, len(array_list), chunk_size)
@@ -126,211 +115,141 @@ async def receive_poll_selection(update: Update, context: CallbackContext) -> No
     poll = context.bot_data[poll_id]["poll"]
 
     if poll == CMD_POLL_TOOL:
-        update_json(FILENAMETOOL, chat_id, questions[answer.option_ids[0]])
+        set_chat_value(FILENAMETOOL, chat_id, questions[answer.option_ids[0]])
     elif poll == CMD_POLL_EXCHANGE:
-        update_json(FILENAMEEXCHANGE, chat_id, questions[answer.option_ids[0]])
-        set_exchange(questions[answer.option_ids[0]])
+        set_chat_value(FILENAMEEXCHANGE, chat_id, questions[answer.option_ids[0]])
+        await load_markets(questions[answer.option_ids[0]])
     elif poll == CMD_POLL_MIN_QUOTE_VOLUME:
-        update_json(FILENAMEMINQUOTEVOLUME, chat_id, questions[answer.option_ids[0]])
+        set_chat_value(FILENAMEMINQUOTEVOLUME, chat_id, questions[answer.option_ids[0]])
     elif poll == CMD_POLL_TIMEFRAME:
         timeframe_list = []
         for question_id in answer.option_ids:
             timeframe_list.append(questions[question_id])
-        update_json(FILENAMETIMEFRAMELIST, chat_id, timeframe_list)
-        set_previous_timeframe_minute_list(chat_id, timeframe_list)
+        set_chat_value(FILENAMETIMEFRAMELIST, chat_id, timeframe_list)
     elif poll == CMD_POLL_BASECOIN:
-        update_json(FILENAMEBASECOIN, chat_id, questions[answer.option_ids[0]])
+        set_chat_value(FILENAMEBASECOIN, chat_id, questions[answer.option_ids[0]])
     elif poll == CMDPOLLPAIRLIST:
         #To be updated to handle multiple poll answers
         valid_coin_pairs = []
         selected_options = answer.option_ids
         for question_id in selected_options:
             valid_coin_pairs.append(questions[question_id])
-        add_json(FILENAMEPAIRLIST, chat_id, valid_coin_pairs)
+        add_chat_value(FILENAMEPAIRLIST, chat_id, valid_coin_pairs)
     elif poll == CMDPOLLINDICATORTRIGGER:
         indicator_trigger_list = []
         selected_options = answer.option_ids
         for question_id in selected_options:
             indicator_trigger_list.append(questions[question_id])
-        update_json(FILENAMEINDICATORTRIGGER, chat_id, indicator_trigger_list)
+        set_chat_value(FILENAMEINDICATORTRIGGER, chat_id, indicator_trigger_list)
     quiz_data = context.bot_data[poll_id]
     await context.bot.stop_poll(quiz_data["chat_id"], quiz_data["message_id"])
 
-def get_message_content(item, timeframe_minute, base_coin, tool, exchange):
-    """Compose content of message"""
-    message_content = ""
-    previour_date_time = ""
-    date_time = item["datetime"]
-    pair = item["pair"]
-    pair_url = f"[{pair}]({get_tool_url(tool, exchange, pair, timeframe_minute)})"
-    close = item["close"]
-    quote_volume_m = item["quote_volume_m"]
-    change_day = item["change_day"]
-    change_day_perc = item["change_day_perc"]
-    signal_list = {}
-    signal = {}
-
-    bb_buy = item["bbBuy"]
-    stoch_buy = item["stochBuy"]
-    stoch_rsi_buy = item["stochRsiBuy"]
-    rsi_buy = item["rsiBuy"]
-
-    bb_sell = item["bbSell"]
-    stoch_sell = item["stochSell"]
-    stoch_rsi_sell = item["stochRsiSell"]
-    rsi_sell = item["rsiSell"]
-
-    bb_signal = bb_buy or bb_sell
-    stoch_signal = stoch_buy or stoch_sell
-    stoch_rsi_signal = stoch_rsi_buy or stoch_rsi_sell
-    rsi_signal = rsi_buy or rsi_sell
-    rsi_max = 70
-    rsi_min = 30
-    rsi = item["rsi"]
-
-    signal_list["Buy"] = [
-        "BB" if bb_buy else '',
-        "Stoch" if stoch_buy else '',
-        "StochRsi" if stoch_rsi_buy else '',
-        "RSIpre" if rsi_buy and rsi > rsi_min else "RSI" if rsi_buy else ''
-    ]
-    signal_list["Sell"] = [
-        "BB" if bb_sell else '',
-        "Stoch" if stoch_sell else '',
-        "StochRsi" if stoch_rsi_sell else '',
-        "RSIpre" if rsi_sell and rsi < rsi_max else "RSI" if rsi_sell else ''
-    ]
-    signal_list["Buy"] = [x for x in signal_list["Buy"] if x != '']
-    signal_list["Sell"] = [x for x in signal_list["Sell"] if x != '']
-
-    signal["Buy"] = ', '.join(signal_list["Buy"])
-    signal["Sell"] = ', '.join(signal_list["Sell"])
-    signal_type = "Buy" if len(signal["Buy"]) > 0 \
-        else "Sell" if len(signal["Sell"]) > 0 else "None"
-    signal_emoji = emoji_type[signal_type]
-    high = item["high"]
-    low = item["low"]
-    bb_width = item["bbWidth"]
-    stoch_k = item["stochK"]
-    stoch_d = item["stochD"]
-    stoch_rsi_d = item["stochRsiD"]
-    stoch_rsi_k = item["stochRsiK"]
-    # Calculate momentum strength by using combination of stoch and rsi
-    momentum_strength = round(rsi)
-
-    macd_value = item["macdValue"]
-    macd_signal = item.get("macdSignal", 0)
-    macd_diff = item.get("macdDiff", 0)
-    ema200 = item.get("ema200", 0)
-    momentum_emoji = ""
-    for key, val in emoji_momentum_level.items():
-        if momentum_strength in key:
-            momentum_emoji = val
-    if previour_date_time != date_time:
-        previour_date_time = date_time
-        message_content += f"{signal_emoji} *{date_time.strftime('%Y %m %d %H%M')} " + \
-            f"| {timeframe_minute} min*\n"
-    # Down arrow if close < ema200, else up arrow
-    ema200_diff = ((close - ema200) / close) * 100
-    ema200_arrow = "\U00002B07" if ema200_diff < 0 else "\U00002B06" if ema200_diff > 0 else "\U00002B0D"
-    stoch_rsi_diff = stoch_rsi_k - stoch_rsi_d
-    stoch_rsi_arrow = "\U00002B07" if stoch_rsi_diff < 0 else "\U00002B06" if stoch_rsi_diff > 0 else "\U00002B0D"
-    stoch_diff = stoch_k - stoch_d
-    stoch_arrow = "\U00002B07" if stoch_diff < 0 else "\U00002B06" if stoch_diff > 0 else "\U00002B0D"
-    message_content += \
-        f"{momentum_emoji} {momentum_strength}% *{pair_url} | [{signal[signal_type]}]*\n" \
-        f"Change day: {change_day:.2f} | {change_day_perc:.2f}% | " + \
-        f"{quote_volume_m:7.2f}M {base_coin}\n" + \
-        f"{'*' if bb_signal else ''}" \
-        f"BB H|L|W: {high:.5f} | {low:.5f} | {bb_width:.2f}%" \
-        f"{'*' if bb_signal else ''}\n" \
-        f"{'*' if stoch_signal else ''}" \
-        f"Stoch D: {stoch_d:.2f}% K: {stoch_k:.2f}% {stoch_arrow} {stoch_diff:.1f}%\n" \
-        f"{'*' if stoch_signal else ''}" \
-        f"{'*' if stoch_rsi_signal else ''}" \
-        f"StochRsi D: {stoch_rsi_d:.2f}% K: {stoch_rsi_k:.2f}% {stoch_rsi_arrow} {stoch_rsi_diff:.1f}%" \
-        f"{'*' if stoch_rsi_signal else ''}\n" \
-        f"{'*' if rsi_signal else ''}" \
-        f"RSI: {rsi:.2f}%" \
-        f"{'*' if rsi_signal else ''}\n" \
-        f"MACD: {macd_value:.3f} Signal: {macd_signal:.3f} Histogram: {macd_diff:.3f}\n" \
-        f"EMA200: {ema200:.5f} {ema200_arrow} {ema200_diff:.3f}%\n" \
-        f"Close: {close:.5f}\n\n"
-    return message_content.replace(".", r"\.").replace("|", r"\|").replace("-", r"\-") \
-        .replace("{", r"\{").replace("}", r"\}")
-
-async def retrieve_all_signals(chat_id, timeframe_list, message, pair_list):
-    """Retrieve all signals"""
-    base_coin = load_json(FILENAMEBASECOIN)
-    indicator_trigger = load_json(FILENAMEINDICATORTRIGGER)
-    tool = load_json(FILENAMETOOL)
-    exchange = load_json(FILENAMEEXCHANGE)
-    for timeframe_minute in timeframe_list:
-        signal_list = await retrieve_signals(
-            message, timeframe_minute, pair_list, indicator_trigger[chat_id])
-        for signal_type in ["Buy", "Sell"]:
-            if signal_type not in signal_list:
-                continue
-            signal_type_list = signal_list[signal_type]
-            if len(signal_type_list) > 0:
-                date_time = signal_type_list[0]["datetime"]
-                await message.reply_text(
-                    fr"{emoji_type[signal_type]} *{date_time.strftime('%Y %m %d %H%M')} \| " + \
-                    fr"{timeframe_minute} min \| {signal_type} signals*",
-                    parse_mode=ParseMode.MARKDOWN_V2)
-                for signal_list in signal_type_list:
-                    await message.reply_text(
-                        get_message_content(
-                            signal_list,
-                            timeframe_minute,
-                            base_coin[chat_id],
-                            tool[chat_id],
-                            exchange[chat_id]),
-                        parse_mode=ParseMode.MARKDOWN_V2)
-
-async def get_signals(context: CallbackContext):
-    """Get signals"""
-    message = context.job.data["message"]
-    chat_id = str(message.chat_id)
-    time_frame_list = load_json(FILENAMETIMEFRAMELIST)
-    if chat_id not in prev_timefram_minute_list:
-        prev_timefram_minute_list[chat_id] = {}
-        for timeframe in time_frame_list[chat_id]:
-            prev_timefram_minute_list[chat_id][int(timeframe)] = datetime.now(
-                pytz.timezone('Europe/Amsterdam')
-            )
+def pack_message_blocks(header, blocks, max_length=MAX_MESSAGE_LENGTH):
+    """Pack header and blocks into as few messages as possible, split only between blocks"""
+    texts = []
+    text = header
+    for block in blocks:
+        if len(text) + len(block) > max_length and len(text) > 0:
+            texts.append(text)
+            text = ""
+        text += block
+    if len(text) > 0:
+        texts.append(text)
+    return texts
+
+async def send_signals(message, chat_id, timeframe_minute, signal_list):
+    """Send signals of timeframe to chat"""
+    base_coin = get_chat_base_coin(chat_id)
+    tool = get_chat_tool(chat_id)
+    exchange = get_chat_exchange(chat_id)
+    for signal_type in ["Buy", "Sell"]:
+        if signal_type not in signal_list:
+            continue
+        signal_type_list = signal_list[signal_type]
+        if len(signal_type_list) > 0:
+            date_time = signal_type_list[0]["datetime"]
+            header = fr"{emoji_type[signal_type]} *{date_time.strftime('%Y %m %d %H%M')} \| " + \
+                fr"{timeframe_minute} min \| {signal_type} signals*"
+            with RENDER_SECONDS.labels(
+                get_chat_label(chat_id), get_timeframe(timeframe_minute)).time():
+                blocks = [
+                    get_message_content(signal, timeframe_minute, base_coin, tool, exchange)
+                    for signal in signal_type_list]
+                if PACK_SIGNALS:
+                    texts = pack_message_blocks(header + "\n\n", blocks)
+                else:
+                    texts = [header] + blocks
+            for text in texts:
+                reply_text(message, text, PRIORITY_SIGNAL, parse_mode=ParseMode.MARKDOWN_V2)
+
+def get_subscriptions(active_chats):
+    """Get subscriptions of active chats"""
+    subscriptions = {}
+    for chat_id in active_chats:
+        time_frame_list = get_chat_timeframes(chat_id)
+        pair_list = get_chat_pairs(chat_id)
+        if time_frame_list is None or pair_list is None:
+            continue
+        subscriptions[chat_id] = {
+            "exchange": get_chat_exchange(chat_id, "binance"),
+            "timeframes": time_frame_list,
+            "pairs": list(dict.fromkeys(pair_list)),
+            "indicator_trigger": get_chat_indicator_trigger(chat_id) or []
+        }
+    return subscriptions
+
+def schedule_scan(job_queue):
+    """Schedule the scan just after the next candle close of the subscribed timeframes"""
+    if scan_running:
+        # The running scan schedules the next scan when finished
+        return
+    for job in job_queue.get_jobs_by_name(SCAN_JOB_NAME):
+        job.schedule_removal()
+    delay = get_next_scan_delay(get_subscriptions(get_active_chats()))
+    if delay is not None:
+        job_queue.run_once(scan_signals, delay, name=SCAN_JOB_NAME)
+    else:
+        # No chat is subscribed anymore
+        update_streams({})
+
+async def scan_signals(context: CallbackContext):
+    """Scan signals of all subscribed chats at once"""
+    global scan_running
+    active_chats = get_active_chats()
 
-    await retrieve_all_signals(
-        chat_id,
-        time_frame_list[chat_id],
-        message,
-        load_json(FILENAMEPAIRLIST))
+    async def send_chat_signals(chat_id, timeframe_minute, signal_list):
+        await send_signals(active_chats[chat_id], chat_id, timeframe_minute, signal_list)
+
+    scan_running = True
+    try:
+        await scan_subscriptions(get_subscriptions(active_chats), send_chat_signals)
+    finally:
+        scan_running = False
+        schedule_scan(context.job_queue)
 
 async def generate_pair_list(context: CallbackContext):
     """Generate pair list"""
-    msg = await context.job.data["message"].reply_text("Update Pair List")
+    msg = await reply_text(context.job.data["message"], "Update Pair List")
     update = context.job.data["update"]
     chat_id = str(msg.chat_id)
-    min_quote_volume = load_json(FILENAMEMINQUOTEVOLUME)
-    if chat_id not in min_quote_volume.keys():
+    min_day_volume = get_chat_min_quote_volume(chat_id)
+    if min_day_volume is None:
         await poll_min_quote_volume(update, context)
-    base_coin = load_json(FILENAMEBASECOIN)
-    if chat_id not in base_coin.keys():
+    base_coin = get_chat_base_coin(chat_id)
+    if base_coin is None:
         await poll_base_coin(update, context)
-    min_day_volume = int(min_quote_volume[chat_id])
     heading = \
-        f"Get pair list with minimum day volume of {min_day_volume:10,d} {base_coin[chat_id]}\n"
-    job_buy = get_job(context.application.job_queue, chat_id)
-    if job_buy is not None:
-        job_buy.pause()
-    valid_coin_pairs = await get_pair_list(base_coin[chat_id], min_day_volume, msg, heading)
-    update_json(FILENAMEPAIRLIST, chat_id, valid_coin_pairs)
-
-    await msg.edit_text(f"Pair List updated with {len(valid_coin_pairs)} pairs")
+        f"Get pair list with minimum day volume of {min_day_volume:10,d} {base_coin}\n"
+    pause(chat_id)
+    valid_coin_pairs = await get_pair_list(
+        get_chat_exchange(chat_id, "binance"), base_coin, min_day_volume, msg, heading)
+    set_chat_value(FILENAMEPAIRLIST, chat_id, valid_coin_pairs)
+
+    edit_text(msg, f"Pair List updated with {len(valid_coin_pairs)} pairs")
     updating_pair_list[chat_id] = False
 
-    if job_buy is not None:
-        job_buy.resume()
+    resume(chat_id)
+    schedule_scan(context.application.job_queue)
 
 # Command methods
 # pylint: disable=unused-argument
@@ -338,13 +257,10 @@ async def start(update: Update, context: CallbackContext):
     """Start"""
     message = update.effective_message
     chat_id = str(update.effective_user.id)
-    exchange = load_json(FILENAMEEXCHANGE)
-    if chat_id not in exchange.keys():
+    if get_chat_exchange(chat_id) is None:
         await poll_exchange(update, context)
         return
-    signals_active = load_json(FILENAMEBUYSIGNALSACTIVE)
-    signals_active_chat_id = chat_id in signals_active and \
-        signals_active[chat_id]
+    signals_active_chat_id = get_chat_signals_active(chat_id)
     menu_list = [
         (CMD_STOP_SIGNALS if signals_active_chat_id else CMD_START_SIGNALS),
         CMD_CHECK_STATUS,
@@ -363,50 +279,47 @@ async def start(update: Update, context: CallbackContext):
     menu_list = [f"/{x}" for x in menu_list]
     keyboard = [menu_list[i:i+2] for i in range(0, len(menu_list), 2)]
     reply_markup = ReplyKeyboardMarkup(keyboard)
-    await message.reply_text("Choose action:", reply_markup=reply_markup)
+    await reply_text(message, "Choose action:", reply_markup=reply_markup)
 
 async def start_signals(update: Update, context: CallbackContext):
     """Start signals"""
     message = update.message if update.callback_query is None else update.callback_query.message
     chat_id = str(message.chat_id)
-    msg = await message.reply_text("Start Checking signals")
+    msg = await reply_text(message, "Start Checking signals")
     job_queue = context.application.job_queue
-    update_json(FILENAMEBUYSIGNALSACTIVE, chat_id, True)
+    set_chat_value(FILENAMEBUYSIGNALSACTIVE, chat_id, True)
     await start(update, context)
 
-    tool = load_json(FILENAMETOOL)
-    if chat_id not in tool.keys():
+    if get_chat_tool(chat_id) is None:
         await stop_signals(update, context)
         await poll_tool(message, context)
         return
 
-    exchange = load_json(FILENAMEEXCHANGE)
-    if chat_id not in exchange.keys():
+    exchange = get_chat_exchange(chat_id)
+    if exchange is None:
         await stop_signals(update, context)
         await poll_exchange(update, context)
         return
-    set_exchange(exchange[chat_id])
 
-    base_coin = load_json(FILENAMEBASECOIN)
-    if chat_id not in base_coin.keys():
+    base_coin = get_chat_base_coin(chat_id)
+    if base_coin is None:
         await stop_signals(update, context)
         await poll_base_coin(update, context)
         return
 
-    min_quote_volume = load_json(FILENAMEMINQUOTEVOLUME)
-    if chat_id not in min_quote_volume.keys():
+    min_quote_volume = get_chat_min_quote_volume(chat_id)
+    if min_quote_volume is None:
         await stop_signals(update, context)
         await poll_min_quote_volume(update, context)
         return
 
-    time_frame_list = load_json(FILENAMETIMEFRAMELIST)
-    if chat_id not in time_frame_list.keys():
+    if get_chat_timeframes(chat_id) is None:
         await poll_time_frame(update, context)
         return
 
-    min_day_volume = float(min_quote_volume[chat_id])/1000000
-    pair_list = load_json(FILENAMEPAIRLIST)
-    if chat_id not in pair_list.keys() or len(pair_list[chat_id]) == 0:
+    min_day_volume = min_quote_volume/1000000
+    pair_list = get_chat_pairs(chat_id)
+    if pair_list is None or len(pair_list) == 0:
         data = context.user_data
         data["message"] = msg
         data["update"] = update
@@ -415,64 +328,57 @@ async def start_signals(update: Update, context: CallbackContext):
     if chat_id in updating_pair_list and updating_pair_list[chat_id]:
         updating_text = "Updating pair list. Pleas wait till finished"
         while updating_pair_list[chat_id]:
-            time.sleep(5)
+            await asyncio.sleep(5)
             updating_text += "."
-            await msg.edit_text(updating_text)
-    await msg.edit_text(
+            edit_text(msg, updating_text)
+    edit_text(msg,
         "Checking signals with minimum day volume " + \
-        f"on {exchange[chat_id]} of {min_day_volume:7.0f}M {base_coin[chat_id]} of Pair List:")
-    pair_list_with_volume = get_pair_list_with_volume(
-        pair_list=pair_list[chat_id], min_quote_volume=min_quote_volume[chat_id])
+        f"on {exchange} of {min_day_volume:7.0f}M {base_coin} of Pair List:")
+    pair_list_with_volume = await get_pair_list_with_volume(
+        exchange_name=exchange, pair_list=get_chat_pairs(chat_id),
+        min_quote_volume=min_quote_volume)
 
     text = "*" + "\n*".join(sorted(pair_list_with_volume))
     max_length = 4096
     parts = [text[i:i+max_length] for i in range(0, len(text), max_length)]
 
     for part in parts:
-        await msg.reply_text(part)
+        reply_text(msg, part)
 
-    data = context.user_data
-    data["update"] = update
-    data["message"] = message
-    data["bot"] = context.bot
-    job_buy = get_job(job_queue, chat_id)
-    if job_buy is None:
-        job_queue.run_repeating(get_signals, 60, data=data, name=chat_id)
-    else:
-        job_buy.resume()
+    subscribe(chat_id, message)
+    schedule_scan(job_queue)
 
 async def stop_signals(update: Update, context: CallbackContext):
     """Stop signals"""
     message = update.message if update.callback_query is None else update.callback_query.message
     chat_id = str(message.chat_id)
-    update_json(FILENAMEBUYSIGNALSACTIVE, chat_id, False)
-    await message.reply_text("Signals stopped")
-    job_buy = get_job(context.application.job_queue, chat_id)
-    if job_buy is not None:
-        job_buy.pause()
+    set_chat_value(FILENAMEBUYSIGNALSACTIVE, chat_id, False)
+    await reply_text(message, "Signals stopped")
+    unsubscribe(chat_id)
     await start(update, context)
 
 async def check_status(update: Update, context: CallbackContext):
     """Check status of scanner"""
     message = update.message if update.callback_query is None else update.callback_query.message
     chat_id = str(message.chat_id)
-    signals_active = load_json(FILENAMEBUYSIGNALSACTIVE)
-    signals_active_chat_id = chat_id in signals_active and \
-        signals_active[chat_id]
-    job_buy = get_job(context.application.job_queue, chat_id)
-    if job_buy is None:
+    signals_active_chat_id = get_chat_signals_active(chat_id)
+    if not is_subscribed(chat_id):
         if not signals_active_chat_id:
             await stop_signals(update, context)
         else:
             await start_signals(update, context)
-    await message.reply_text(
-        "Scanner is " + ("" if signals_active_chat_id else "NOT ") + "checking signals")
+    exchange_id = get_exchange(get_chat_exchange(chat_id, "binance")).id
+    await reply_text(message,
+        "Scanner is " + ("" if signals_active_chat_id else "NOT ") + "checking signals\n" +
+        f"Request budget of {exchange_id}: {get_remaining_budget(exchange_id)} of " +
+        f"{get_budget(exchange_id).limit} weight left")
 
-def get_pair_list_with_volume(pair_list, min_quote_volume):
+async def get_pair_list_with_volume(exchange_name, pair_list, min_quote_volume):
     """Get pair list with volume"""
     pair_list_with_volume = []
+    tickers = await fetch_tickers(exchange_name, pair_list, priority=PRIORITY_DISCOVERY)
     for coin_pair in pair_list:
-        ticker = fetch_ticker(coin_pair)
+        ticker = tickers.get(coin_pair)
         if ticker is None:
             continue
         quote_volume = ticker["quoteVolume"]
@@ -485,81 +391,81 @@ async def display_pair_list_header(update: Update, context: CallbackContext):
     message = update.message if update.callback_query is None else update.callback_query.message
     chat_id = str(message.chat_id)
 
-    pair_list = load_json(FILENAMEPAIRLIST)
-    if chat_id not in pair_list.keys():
+    pair_list = get_chat_pairs(chat_id)
+    if pair_list is None:
         await update_pair_list(update, context)
-        await message.reply_text(
+        await reply_text(message,
             f"First select pairs with /{CMDPOLLPAIRLIST} and click again on " + \
             f"/{CMD_DISPLAY_PAIRS} to display the pair list" + \
             f"/{CMD_DISPLAY_SETTINGS} to display the settings")
         return
-    await message.reply_text(f"Pair List contains {len(pair_list[chat_id])} pairs")
+    await reply_text(message, f"Pair List contains {len(pair_list)} pairs")
 
 async def display_settings(update: Update, context: CallbackContext):
     """Display settings"""
     message = update.message if update.callback_query is None else update.callback_query.message
     chat_id = str(message.chat_id)
 
-    tool = load_json(FILENAMETOOL)
-    if chat_id not in tool.keys():
+    tool = get_chat_tool(chat_id)
+    if tool is None:
         await poll_tool(update, context)
         return
 
-    exchange = load_json(FILENAMEEXCHANGE)
-    if chat_id not in exchange.keys():
+    exchange = get_chat_exchange(chat_id)
+    if exchange is None:
         await poll_exchange(update, context)
         return
-    set_exchange(exchange[chat_id])
 
-    base_coin = load_json(FILENAMEBASECOIN)
-    if chat_id not in base_coin.keys():
+    base_coin = get_chat_base_coin(chat_id)
+    if base_coin is None:
         await poll_base_coin(update, context)
         return
 
-    min_quote_volume = load_json(FILENAMEMINQUOTEVOLUME)
-    if chat_id not in min_quote_volume.keys():
+    min_quote_volume = get_chat_min_quote_volume(chat_id)
+    if min_quote_volume is None:
         await poll_min_quote_volume(update, context)
         return
 
-    time_frame_list = load_json(FILENAMETIMEFRAMELIST)
-    if chat_id not in time_frame_list.keys():
+    time_frame_list = get_chat_timeframes(chat_id)
+    if time_frame_list is None:
         await poll_time_frame(update, context)
         return
 
-    indicator_trigger = load_json(FILENAMEINDICATORTRIGGER)
-    if chat_id not in indicator_trigger.keys():
+    indicator_trigger = get_chat_indicator_trigger(chat_id)
+    if indicator_trigger is None:
         await poll_indicator_trigger(update, context)
         return
 
-    await message.reply_text(
+    await reply_text(message,
         "Settings:\n" +
-        f"Tool: {tool[chat_id]}\n" +
-        f"Exchange: {exchange[chat_id]}\n" +
-        f"Base Coin: {base_coin[chat_id]}\n" +
-        f"Minimum Quote Volume: {min_quote_volume[chat_id]}\n" +
-        f"Time Frame List: {', '.join(time_frame_list[chat_id])}\n" +
-        f"Indicator Trigger: {', '.join(indicator_trigger[chat_id])}\n")
+        f"Tool: {tool}\n" +
+        f"Exchange: {exchange}\n" +
+        f"Base Coin: {base_coin}\n" +
+        f"Minimum Quote Volume: {min_quote_volume}\n" +
+        f"Time Frame List: {', '.join(time_frame_list)}\n" +
+        f"Indicator Trigger: {', '.join(indicator_trigger)}\n")
     await display_pair_list_header(update, context)
 
 async def display_pairs(update: Update, context: CallbackContext):
     """Display pairs"""
     message = update.message if update.callback_query is None else update.callback_query.message
     chat_id = str(message.chat_id)
-    min_quote_volume = load_json(FILENAMEMINQUOTEVOLUME)
-    if chat_id not in min_quote_volume.keys():
+    min_quote_volume = get_chat_min_quote_volume(chat_id)
+    if min_quote_volume is None:
         await poll_min_quote_volume(update, context)
         return
 
     await display_pair_list_header(update, context)
-    msg = await message.reply_text("Get Pair list with volume ...Please wait")
+    msg = await reply_text(message, "Get Pair list with volume ...Please wait")
 
-    pair_list = load_json(FILENAMEPAIRLIST)
-    if chat_id not in pair_list.keys():
+    pair_list = get_chat_pairs(chat_id)
+    if pair_list is None:
         return
-    pair_list_with_volume = get_pair_list_with_volume(
-        pair_list=pair_list[chat_id], min_quote_volume=min_quote_volume[chat_id])
+    pair_list_with_volume = await get_pair_list_with_volume(
+        exchange_name=get_chat_exchange(chat_id, "binance"), pair_list=pair_list,
+        min_quote_volume=min_quote_volume)
 
-    await msg.edit_text("Finished Get Pair list with volume")
+    edit_text(msg, "Finished Get Pair list with volume")
 
     # Split the long message into smaller messages
     text = "*" + ("\n*".join(sorted(pair_list_with_volume)))
@@ -567,7 +473,7 @@ async def display_pairs(update: Update, context: CallbackContext):
     parts = [text[i:i+max_length] for i in range(0, len(text), max_length)]
 
     for part in parts:
-        await message.reply_text(part)
+        reply_text(message, part)
 
 async def poll_tool(update: Update, context: CallbackContext) -> None:
     """Poll tool"""
@@ -700,16 +606,14 @@ async def poll_pair_list(update: Update, context: CallbackContext) -> None:
     """Poll pair list"""
     message = update.message if update.callback_query is None else update.callback_query.message
     chat_id = str(message.chat_id)
-    base_coin = load_json(FILENAMEBASECOIN)
-    if chat_id not in base_coin.keys():
+    if get_chat_base_coin(chat_id) is None:
         await poll_base_coin(update, context)
-    pair_list = load_json(FILENAMEPAIRLIST)
-    if chat_id not in pair_list.keys():
+    pair_list = get_chat_pairs(chat_id)
+    if pair_list is None:
         await update_pair_list(update, context)
     else:
-        question_list = split_with_numpy(pair_list[chat_id], 10)
-        pair_list[chat_id].clear()
-        save_json(FILENAMEPAIRLIST, pair_list)
+        question_list = split_with_numpy(pair_list, 10)
+        set_chat_value(FILENAMEPAIRLIST, chat_id, [])
         for questions in question_list:
             if len(questions) == 1:
                 questions.append("End of List")
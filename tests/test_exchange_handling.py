@@ -0,0 +1,110 @@
+"""Tests of the candle fetches of the scans against the fake exchange"""
+import asyncio
+import os
+import sys
+import ccxt
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIRECTORY)
+sys.path.insert(0, os.path.join(ROOT_DIRECTORY, "benchmarks"))
+
+# pylint: disable=wrong-import-position
+import budget_handling
+import exchange_handling
+from budget_handling import PRIORITY_LIVE
+from candle_handling import get_candle_buffer
+from fake_exchange import FakeExchange
+
+TIMEFRAME_MINUTE = 5
+TIMEFRAME_MS = TIMEFRAME_MINUTE * 60000
+
+def reset_markets(monkeypatch):
+    """Forget the markets and their refresh tasks loaded by other tests"""
+    for name in ["market_refresh_tasks", "market_locks", "market_index"]:
+        monkeypatch.setattr(exchange_handling, name, {})
+
+def set_up_exchange(monkeypatch, tmp_path):
+    """Install the fake exchange with its clock standing still after a candle close"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(exchange_handling, "STORE_HISTORY", False)
+    reset_markets(monkeypatch)
+    exchange = FakeExchange(1, latency=0)
+    monkeypatch.setitem(exchange_handling.exchanges, "binance", exchange)
+    monkeypatch.setitem(budget_handling.REQUEST_WEIGHT_LIMITS, "binance", (sys.maxsize, 60))
+    monkeypatch.setitem(exchange_handling.clock_offsets, "binance", None)
+    # Two seconds after the close of a candle of the timeframe, like a scheduled scan
+    local_time = exchange.milliseconds()
+    exchange.local_time = local_time - local_time % TIMEFRAME_MS + 2000
+    monkeypatch.setattr(exchange_handling, "get_local_milliseconds", lambda: exchange.local_time)
+    requests = []
+    fetch_ohlcv = exchange_handling.fetch_ohlcv
+
+    async def record_fetch_ohlcv(exchange_name, pair, timeframe, since=None, limit=500,
+                                 priority=PRIORITY_LIVE):
+        requests.append((timeframe, since, limit, priority))
+        return await fetch_ohlcv(exchange_name, pair, timeframe, since, limit, priority)
+    monkeypatch.setattr(exchange_handling, "fetch_ohlcv", record_fetch_ohlcv)
+    return exchange, requests
+
+def test_next_resampled_scan_fetches_base_candles_incrementally(monkeypatch, tmp_path):
+    exchange, requests = set_up_exchange(monkeypatch, tmp_path)
+    pair = exchange.pairs[0]
+    base_buffer = get_candle_buffer(exchange.id, pair, "1m")
+
+    async def scan_twice():
+        await exchange_handling.scan_pairs("binance", TIMEFRAME_MINUTE, [pair], [["rsi"]])
+        first_timestamp = base_buffer.first_timestamp()
+        requests.clear()
+        exchange.local_time += TIMEFRAME_MS
+        data = await exchange_handling.scan_pairs(
+            "binance", TIMEFRAME_MINUTE, [pair], [["rsi"]])
+        return first_timestamp, data
+
+    try:
+        first_timestamp, data = asyncio.run(scan_twice())
+        assert pair in data
+        # The base buffer is kept and only the base candles of the new candle are fetched
+        assert base_buffer.first_timestamp() == first_timestamp
+        assert [(timeframe, since is not None, priority)
+                for timeframe, since, _, priority in requests] == [("1m", True, PRIORITY_LIVE)]
+    finally:
+        base_buffer.clear()
+        get_candle_buffer(exchange.id, pair, f"{TIMEFRAME_MINUTE}m").clear()
+
+class UnreachableExchange(FakeExchange):
+    """Fake exchange of which the first download of the markets fails"""
+
+    def __init__(self, pair_count):
+        super().__init__(pair_count, latency=0)
+        self.failures = 1
+
+    async def load_markets(self, reload=False, params={}):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ccxt.ExchangeNotAvailable("maintenance")
+        return await super().load_markets(reload, params)
+
+def test_failed_first_markets_download_is_retried_in_background(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(exchange_handling, "MARKETS_RETRY_DELAY", 0)
+    reset_markets(monkeypatch)
+    exchange = UnreachableExchange(1)
+    monkeypatch.setitem(exchange_handling.exchanges, "binance", exchange)
+    monkeypatch.setitem(budget_handling.REQUEST_WEIGHT_LIMITS, "binance", (sys.maxsize, 60))
+
+    async def load_twice():
+        try:
+            await exchange_handling.load_markets("binance")
+            raise AssertionError("markets loaded while the exchange is unreachable")
+        except ccxt.ExchangeNotAvailable:
+            pass
+        task = exchange_handling.market_refresh_tasks[exchange.id]
+        for _ in range(200):
+            if exchange.markets is not None:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        return exchange.markets
+
+    assert asyncio.run(load_twice()) is not None
+    assert exchange.pairs[0] in exchange_handling.get_active_symbols("binance", "USDT")
@@ -0,0 +1,44 @@
+"""Tests of the candle stores shared by the bot and the backtests"""
+import fcntl
+import os
+import sys
+import threading
+import numpy as np
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIRECTORY)
+
+# pylint: disable=wrong-import-position
+from history_handling import CandleStore
+
+TIMEFRAME_MS = 60000
+
+def get_bars(first_timestamp, count):
+    """Get count candles from first timestamp"""
+    return [[first_timestamp + index * TIMEFRAME_MS, 100.0, 101.0, 99.0, 100.5, 10.0]
+            for index in range(count)]
+
+def test_read_last_starts_after_gap(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append(get_bars(0, 10), TIMEFRAME_MS)
+    # Five candles are missing before the appended candles
+    store.append(get_bars(15 * TIMEFRAME_MS, 3), TIMEFRAME_MS)
+    candles = store.read_last(8)
+    assert candles[:, 0].tolist() == [(15 + index) * TIMEFRAME_MS for index in range(3)]
+    # A warm start of another process reads the same complete history
+    assert CandleStore(str(tmp_path)).read_last(8)[:, 0].tolist() == candles[:, 0].tolist()
+
+def test_append_waits_for_lock_of_other_process(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append(get_bars(0, 2), TIMEFRAME_MS)
+    # A lock taken on another open of the lock file blocks like the lock of another process
+    with open(store.lock_file_name, "a", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        thread = threading.Thread(
+            target=store.append, args=(get_bars(2 * TIMEFRAME_MS, 2), TIMEFRAME_MS))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+        assert len(CandleStore(str(tmp_path))) == 2
+    thread.join()
+    assert np.array_equal(store.read()[:, 0], [index * TIMEFRAME_MS for index in range(4)])
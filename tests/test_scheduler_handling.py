@@ -0,0 +1,53 @@
+"""Tests of the scheduled scans of the subscriptions"""
+import asyncio
+import os
+import sys
+import ccxt
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIRECTORY)
+
+# pylint: disable=wrong-import-position
+import scheduler_handling
+
+CANDLE_CLOSE = 1792301100000
+
+def test_retried_scan_skips_chats_already_sent(monkeypatch):
+    monkeypatch.setattr(scheduler_handling, "SCAN_CHUNK_SIZE", 1)
+    monkeypatch.setattr(scheduler_handling, "SCAN_RETRY_DELAY", 0)
+    monkeypatch.setattr(scheduler_handling, "scanned_candles", {})
+    monkeypatch.setattr(scheduler_handling, "scan_retry_times", {})
+    monkeypatch.setattr(scheduler_handling, "served_chats", {})
+    monkeypatch.setattr(scheduler_handling, "get_candle_close", lambda *_: CANDLE_CLOSE)
+    monkeypatch.setattr(scheduler_handling, "filter_signals", lambda data, _: data)
+    monkeypatch.setattr(scheduler_handling, "observe_scan", lambda *_: None)
+    subscriptions = {
+        1: {"pairs": ["BTC/USDT"], "indicator_trigger": ["rsi"]},
+        2: {"pairs": ["ETH/USDT"], "indicator_trigger": ["rsi"]}}
+    scanned_chunks = []
+
+    async def scan_pairs(exchange_name, timeframe_minute, pairs, indicator_trigger_lists):
+        scanned_chunks.append(pairs)
+        # The candles of the second chunk fail to download the first time
+        if pairs == ["ETH/USDT"] and scanned_chunks.count(pairs) == 1:
+            raise ccxt.NetworkError("timeout")
+        return {pair: {} for pair in pairs}
+    monkeypatch.setattr(scheduler_handling, "scan_pairs", scan_pairs)
+    sent = []
+
+    async def send_signals(chat_id, timeframe_minute, signals):
+        sent.append(chat_id)
+
+    async def scan_twice():
+        for _ in range(2):
+            try:
+                await scheduler_handling.scan_group(
+                    "binance", 5, [1, 2], subscriptions, send_signals)
+            except ccxt.NetworkError:
+                pass
+
+    asyncio.run(scan_twice())
+    assert sent == [1, 2]
+    assert scanned_chunks == [["BTC/USDT"], ["ETH/USDT"], ["ETH/USDT"]]
+    assert scheduler_handling.scanned_candles[("binance", 5)] == CANDLE_CLOSE
+    assert scheduler_handling.served_chats == {}
@@ -0,0 +1,180 @@
+"""Tests of the candle streams against a local WebSocket server sending binance kline frames"""
+import asyncio
+import json
+import os
+import sys
+import time
+import ccxt.pro as ccxt_pro
+from aiohttp import web, WSMsgType
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIRECTORY)
+
+# pylint: disable=wrong-import-position
+import budget_handling
+import exchange_handling
+import stream_handling
+from candle_handling import get_candle_buffer
+
+PAIR = "BTC/USDT"
+TIMEFRAME_MS = 60000
+DEPTH = 30
+
+class StreamServer:
+    """Local WebSocket server answering subscriptions and sending the kline frames of the test"""
+
+    def __init__(self):
+        self.connections = []
+        self.subscriptions = []
+        self.runner = None
+        self.url = None
+
+    async def start(self):
+        """Listen on a free local port"""
+        application = web.Application()
+        application.router.add_get("/{path:.*}", self.handle)
+        self.runner = web.AppRunner(application)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"ws://{host}:{port}/ws"
+
+    async def stop(self):
+        """Close the connections and stop listening"""
+        await self.runner.cleanup()
+
+    async def handle(self, request):
+        """Answer the subscriptions of a connection till it is closed"""
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.connections.append(websocket)
+        async for message in websocket:
+            if message.type == WSMsgType.TEXT:
+                subscription = json.loads(message.data)
+                self.subscriptions.append(subscription["params"])
+                await websocket.send_json({"result": None, "id": subscription["id"]})
+        return websocket
+
+    async def send_kline(self, timestamp, close):
+        """Send kline frame of the candle at timestamp on the last connection"""
+        await self.connections[-1].send_json({
+            "e": "kline", "E": timestamp + 1000, "s": "BTCUSDT", "k": {
+                "t": timestamp, "T": timestamp + TIMEFRAME_MS - 1, "s": "BTCUSDT", "i": "1m",
+                "o": "100.0", "h": "101.0", "l": "99.0", "c": str(close), "v": "10.0",
+                "x": False}})
+
+class StreamBinance(ccxt_pro.binance):
+    """Binance client of which the markets and the REST candles are served by the test"""
+
+    def __init__(self, config={}):
+        super().__init__(config)
+        self.ohlcv_requests = []
+        self.set_markets([{
+            "id": "BTCUSDT", "lowercaseId": "btcusdt", "symbol": PAIR, "base": "BTC",
+            "quote": "USDT", "baseId": "BTC", "quoteId": "USDT", "type": "spot", "spot": True,
+            "contract": False, "linear": None, "active": True}])
+
+    async def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params={}):
+        self.ohlcv_requests.append((since, limit))
+        current_timestamp = exchange_handling.get_current_candle_timestamp("binance", timeframe)
+        first_timestamp = current_timestamp - (limit - 1) * TIMEFRAME_MS if since is None \
+            else since
+        return [[timestamp, 100.0, 101.0, 99.0, 100.5, 10.0] for timestamp in range(
+            first_timestamp, current_timestamp + 1, TIMEFRAME_MS)][:limit]
+
+def set_clock(monkeypatch, offset):
+    """Set the offset of the synchronised clock of binance"""
+    monkeypatch.setitem(exchange_handling.clock_offsets, "binance", {
+        "time": time.monotonic(), "offset": offset})
+
+def set_up_stream(monkeypatch, tmp_path, server):
+    """Point the binance stream at the local server with the clock at the start of a candle"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stream_handling, "STREAM_RECONNECT_DELAY", 0)
+    monkeypatch.setattr(exchange_handling, "CANDLE_STREAMING", True)
+    monkeypatch.setattr(exchange_handling, "STORE_HISTORY", False)
+    monkeypatch.setattr(exchange_handling, "exchanges", {})
+    monkeypatch.setattr(ccxt_pro, "binance", StreamBinance)
+    monkeypatch.setitem(exchange_handling.STREAM_URLS, "binance", {"spot": server.url})
+    monkeypatch.setitem(budget_handling.REQUEST_WEIGHT_LIMITS, "binance", (sys.maxsize, 60))
+    # A second into the candle, the candle of the clock does not change during the test
+    local_time = exchange_handling.get_local_milliseconds()
+    offset = TIMEFRAME_MS - local_time % TIMEFRAME_MS + 1000
+    set_clock(monkeypatch, offset)
+    return offset
+
+async def wait_for(condition):
+    """Wait till condition holds while the stream runs"""
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+def get_candles():
+    """Get candles in the candle buffer of the pair"""
+    return get_candle_buffer("binance", PAIR, "1m").get_candles()
+
+def run_stream(monkeypatch, tmp_path, test):
+    """Run test with the server while the candles of the pair are streamed"""
+    async def run():
+        server = StreamServer()
+        await server.start()
+        offset = set_up_stream(monkeypatch, tmp_path, server)
+        try:
+            stream_handling.update_streams({("binance", PAIR, "1m"): DEPTH})
+            await test(server, exchange_handling.get_exchange("binance"), offset)
+        finally:
+            await stream_handling.close_streams()
+            await exchange_handling.close_exchanges()
+            await server.stop()
+            get_candle_buffer("binance", PAIR, "1m").clear()
+    asyncio.run(run())
+
+def test_subscribe_backfills_depth_and_stores_streamed_candles(monkeypatch, tmp_path):
+    async def test(server, exchange, _):
+        await wait_for(lambda: len(server.subscriptions) == 1)
+        assert server.subscriptions == [["btcusdt@kline_1m"]]
+        assert exchange.ohlcv_requests == [(None, DEPTH + 1)]
+        current_timestamp = get_candles()[-1, 0]
+        await server.send_kline(current_timestamp, 102.5)
+        await wait_for(lambda: get_candles()[-1, 4] == 102.5)
+        assert get_candles()[-1, 0] == current_timestamp
+        await server.send_kline(current_timestamp + TIMEFRAME_MS, 103.5)
+        await wait_for(lambda: get_candles()[-1, 0] == current_timestamp + TIMEFRAME_MS)
+        assert len(exchange.ohlcv_requests) == 1
+
+    run_stream(monkeypatch, tmp_path, test)
+
+def test_gap_in_stream_is_backfilled_over_rest(monkeypatch, tmp_path):
+    async def test(server, exchange, offset):
+        await wait_for(lambda: len(server.subscriptions) == 1)
+        current_timestamp = get_candles()[-1, 0]
+        # The stream missed two candles while the clock moved on
+        set_clock(monkeypatch, offset + 3 * TIMEFRAME_MS)
+        await server.send_kline(current_timestamp + 3 * TIMEFRAME_MS, 102.5)
+        await wait_for(lambda: len(exchange.ohlcv_requests) == 2)
+        assert exchange.ohlcv_requests[1][0] == current_timestamp
+        await wait_for(lambda: get_candles()[-1, 0] == current_timestamp + 3 * TIMEFRAME_MS)
+        assert get_candles()[-4:, 0].tolist() == [
+            current_timestamp + index * TIMEFRAME_MS for index in range(4)]
+
+    run_stream(monkeypatch, tmp_path, test)
+
+def test_dropped_connection_is_backfilled_and_reconnected(monkeypatch, tmp_path):
+    async def test(server, exchange, offset):
+        await wait_for(lambda: len(server.subscriptions) == 1)
+        current_timestamp = get_candles()[-1, 0]
+        # The connection drops while the next candle opens
+        set_clock(monkeypatch, offset + TIMEFRAME_MS)
+        await server.connections[0].close()
+        await wait_for(lambda: len(server.subscriptions) == 2)
+        assert len(server.connections) == 2
+        # The candles missed while not subscribed are fetched before resubscribing
+        assert len(exchange.ohlcv_requests) == 2
+        assert get_candles()[-1, 0] == current_timestamp + TIMEFRAME_MS
+        await server.send_kline(current_timestamp + TIMEFRAME_MS, 102.5)
+        await wait_for(lambda: get_candles()[-1, 4] == 102.5)
+
+    run_stream(monkeypatch, tmp_path, test)
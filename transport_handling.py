@@ -0,0 +1,124 @@
+"""Transport handling, records the responses of the exchanges to disk and replays them offline"""
+import asyncio
+import json
+import os
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import ccxt
+
+# "live" sends the requests to the exchange, "record" also writes the responses to the
+# recording directory, "replay" answers the requests from the recording without network
+TRANSPORT_MODE = os.environ.get("EXCHANGE_TRANSPORT", "live")
+RECORDING_DIRECTORY = os.environ.get("EXCHANGE_RECORDING", "./recordings")
+# Speed of the replayed clock and latencies, 1 is the original timing, 60 compresses an hour
+# into a minute
+REPLAY_SPEED = float(os.environ.get("EXCHANGE_REPLAY_SPEED", "1"))
+# Query parameters that change with the clock or the key, ignored when no response of the
+# exact request is recorded
+VOLATILE_PARAMS = {"startTime", "endTime", "since", "timestamp", "recvWindow", "signature"}
+
+recording_locks = {}
+recordings = {}
+replay_clock = {}
+
+def get_recording_file_name(exchange_id):
+    """Get file name of the recording of exchange"""
+    return os.path.join(RECORDING_DIRECTORY, f"{exchange_id}.jsonl")
+
+def get_request_key(method, url, body):
+    """Get key of request without the volatile query parameters"""
+    parts = urlsplit(url)
+    params = [(name, value) for name, value in parse_qsl(parts.query)
+              if name not in VOLATILE_PARAMS]
+    return f"{method} {parts.netloc}{parts.path}?{urlencode(sorted(params))} {body or ''}"
+
+def write_recording(file_name, line):
+    """Append line to the recording"""
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(file_name, "a", encoding="utf-8") as file:
+        file.write(line + "\n")
+
+async def record_response(exchange_id, entry):
+    """Append the response of a request to the recording of exchange in order"""
+    if exchange_id not in recording_locks:
+        recording_locks[exchange_id] = asyncio.Lock()
+    async with recording_locks[exchange_id]:
+        await asyncio.to_thread(
+            write_recording, get_recording_file_name(exchange_id), json.dumps(entry))
+
+def load_recording(exchange_id):
+    """Load the recorded responses of exchange by request key"""
+    if exchange_id not in recordings:
+        responses = {}
+        with open(get_recording_file_name(exchange_id), encoding="utf-8") as file:
+            for line in file:
+                entry = json.loads(line)
+                responses.setdefault(
+                    get_request_key(entry["method"], entry["url"], entry["body"]), []).append(entry)
+                if "time" not in replay_clock or entry["time"] < replay_clock["time"]:
+                    replay_clock["time"] = entry["time"]
+        recordings[exchange_id] = responses
+    return recordings[exchange_id]
+
+def get_recorded_response(exchange_id, method, url, body):
+    """Get the next recorded response of request, the last one is repeated when all are used"""
+    responses = load_recording(exchange_id).get(get_request_key(method, url, body))
+    if not responses:
+        raise ccxt.NetworkError(f"No recorded response of {exchange_id} for {method} {url}")
+    # Prefer the response of the exact request, else the next response of the endpoint
+    index = next((index for index, entry in enumerate(responses)
+                  if entry["url"] == url and entry["body"] == body), 0)
+    return responses.pop(index) if len(responses) > 1 else responses[0]
+
+def get_local_milliseconds():
+    """Get local time in milliseconds, the recorded time running at replay speed when replaying"""
+    if TRANSPORT_MODE != "replay" or "time" not in replay_clock:
+        return int(time.time() * 1000)
+    if "start" not in replay_clock:
+        replay_clock["start"] = time.monotonic()
+    return int(replay_clock["time"] + (time.monotonic() - replay_clock["start"]) * 1000 *
+               REPLAY_SPEED)
+
+def get_clock_speed():
+    """Get speed of the local clock compared with the real time"""
+    return REPLAY_SPEED if TRANSPORT_MODE == "replay" else 1
+
+def install_transport(exchange):
+    """Record or replay the requests of the exchange client depending on the transport mode"""
+    if TRANSPORT_MODE == "live":
+        return
+    if TRANSPORT_MODE not in ["record", "replay"]:
+        raise ValueError(f"Unknown exchange transport {TRANSPORT_MODE}")
+    fetch = exchange.fetch
+
+    async def record_fetch(url, method="GET", headers=None, body=None):
+        entry = {"time": get_local_milliseconds(), "method": method, "url": url, "body": body}
+        start_time = time.monotonic()
+        error = None
+        try:
+            entry["response"] = await fetch(url, method, headers, body)
+        except ccxt.BaseError as exception:
+            error = exception
+            entry["error"] = [type(exception).__name__, str(exception)]
+        entry["duration"] = (time.monotonic() - start_time) * 1000
+        entry["headers"] = dict(exchange.last_response_headers or {})
+        await record_response(exchange.id, entry)
+        if error is not None:
+            raise error
+        return entry["response"]
+
+    async def replay_fetch(url, method="GET", headers=None, body=None):
+        entry = get_recorded_response(exchange.id, method, url, body)
+        await asyncio.sleep(entry["duration"] / 1000 / REPLAY_SPEED)
+        exchange.last_response_headers = entry["headers"]
+        if "error" in entry:
+            error_name, error_message = entry["error"]
+            raise getattr(ccxt, error_name, ccxt.ExchangeError)(error_message)
+        return entry["response"]
+
+    if TRANSPORT_MODE == "record":
+        exchange.fetch = record_fetch
+    else:
+        exchange.fetch = replay_fetch
+        exchange.milliseconds = get_local_milliseconds
+        load_recording(exchange.id)